@@ -1,14 +1,13 @@
 # Area charts
-import lightningchart as lc
-import pandas as pd
 import numpy as np
-from scipy.stats import gaussian_kde
+from compute import headless
+from data_loader import load_data
+from binned_kde import grouped_kde, kde
+from instrumentation import stage
 
-lc.set_license('my-license-key')
 file_path = 'machine_temperature_system_failure.csv'
-data = pd.read_csv(file_path)
+data = load_data(file_path)
 
-data['timestamp'] = pd.to_datetime(data['timestamp'])
 data['year'] = data['timestamp'].dt.year
 data['month'] = data['timestamp'].dt.month
 
@@ -16,23 +15,24 @@ temperature_values = data['value'].values
 
 years = data['year'].unique()
 months = data['month'].unique()
-data_by_year = {year: data[data['year'] == year]['value'] for year in years}
-data_by_month = {month: data[data['month'] == month]['value'] for month in months}
 
-# Calculate density
-densities_by_year = {year: gaussian_kde(values) for year, values in data_by_year.items()}
-densities_by_month = {month: gaussian_kde(values) for month, values in data_by_month.items()}
+# Calculate density, every year (and every month) in one binned pass
 x_vals = np.linspace(min(temperature_values), max(temperature_values), 100)
-y_vals_year = {year: density(x_vals) for year, density in densities_by_year.items()}
-y_vals_month = {month: density(x_vals) for month, density in densities_by_month.items()}
+y_vals_year = grouped_kde(temperature_values, data['year'].values, x_vals)
+y_vals_month = grouped_kde(temperature_values, data['month'].values, x_vals)
+y_vals_distribution = kde(temperature_values, x_vals)
+# with --no-render the density curves go to results/area_charts.npz and nothing is drawn
+headless('area_charts', x=x_vals, density=y_vals_distribution, year=y_vals_year, month=y_vals_month)
+
+import lightningchart as lc
+
+lc.set_license('my-license-key')
 
 dashboard = lc.Dashboard(rows=1, columns=3, theme=lc.Themes.Black)
 
 distribution_chart = dashboard.ChartXY(column_index=0, row_index=0)
 distribution_chart.set_title('Temperature Distribution')
 
-distribution_density = gaussian_kde(temperature_values)
-y_vals_distribution = distribution_density(x_vals)
 series_distribution = distribution_chart.add_positive_area_series()
 series_distribution.add(x_vals.tolist(), y_vals_distribution.tolist())
 
@@ -63,4 +63,5 @@ month_chart.add_legend()
 month_chart.get_default_x_axis().set_title('Temperature')
 month_chart.get_default_y_axis().set_title('Density')
 
-dashboard.open()
+with stage('lightningchart:open'):
+    dashboard.open()
@@ -1,53 +1,39 @@
 # Bar Chart - Anomaly Scores
-import lightningchart as lc
-import pandas as pd
-from scipy.stats import chi2
-from datetime import datetime
-from sklearn.svm import OneClassSVM
-from sklearn.ensemble import IsolationForest
-from sklearn.neighbors import LocalOutlierFactor
-import changefinder
-import numpy as np
-
-lc.set_license('my-license-key')
+from compute import detector_results, headless
+from data_loader import load_data
+from instrumentation import stage
+from score_matrix import ScoreMatrix
+from sketches import score_summary
 
 file_path = 'machine_temperature_system_failure.csv'
-data = pd.read_csv(file_path)
-
-data['timestamp'] = pd.to_datetime(data['timestamp'])
-
-def calculate_anomaly_scores(data):
-    # Hotelling's T²
-    mean = data['value'].mean()
-    std = data['value'].std()
-    data['hotelling_score'] = ((data['value'] - mean) / std) ** 2
+data = load_data(file_path)
+values = data['value'].values
+# 'nystroem' or 'sample' keep One-Class SVM usable on long histories, see ocsvm_approx.py
+ocsvm_mode = 'exact'
+# 'sorted' is a much faster 1-D LOF whose tie-breaking can differ from sklearn's, see lof_1d.py
+lof_mode = 'exact'
+results = detector_results(values, {
+    'hotelling': 'hotelling',
+    'ocsvm': ('ocsvm', {'mode': ocsvm_mode}),
+    'iforest': 'iforest',
+    'lof': ('lof', {'mode': lof_mode}),
+    'changefinder': 'changefinder',
+})
+# with --no-render the scores and labels go to results/anomaly_scores.npz and nothing is drawn
+headless('anomaly_scores', results, timestamp_ms=data['timestamp_unix'].values)
 
-    # One-Class SVM
-    ocsvm_model = OneClassSVM(nu=0.2, gamma=0.001, kernel='rbf')
-    ocsvm_model.fit(data[['value']])
-    data['ocsvm_score'] = ocsvm_model.decision_function(data[['value']])
-
-    # Isolation Forest
-    iforest_model = IsolationForest(n_estimators=300, contamination=0.1, max_samples=700, random_state=42)
-    iforest_model.fit(data[['value']])
-    data['iforest_score'] = iforest_model.decision_function(data[['value']])
-
-    # LOF (Local Outlier Factor)
-    lof_model = LocalOutlierFactor(n_neighbors=500, contamination=0.07)
-    lof_scores = lof_model.fit_predict(data[['value']])
-    data['lof_score'] = lof_model.negative_outlier_factor_
+import lightningchart as lc
 
-    # ChangeFinder
-    cf_model = changefinder.ChangeFinder(r=0.002, order=1, smooth=250)
-    data['cf_score'] = [cf_model.update(value) for value in data['value']]
-    
-    return data
+lc.set_license('my-license-key')
 
-data = calculate_anomaly_scores(data)
+# one float32 score column per detector instead of five float64 columns on the frame
+matrix = ScoreMatrix.from_results(results)
+del results
+# 50 bins over each detector's score range, filled chunk by chunk
+histograms = {name: score_summary(matrix.scores(name), bins=50)[0] for name in matrix.names}
 
-def plot_histogram(data, column, title, chart):
-    counts, bins = np.histogram(data[column], bins=50)
-    bar_data = [{'category': str(bins[i]), 'value': int(counts[i])} for i in range(len(counts))]
+def plot_histogram(histogram, title, chart):
+    bar_data = [{'category': str(edge), 'value': int(count)} for edge, count in zip(histogram.edges, histogram.counts)]
 
     chart.set_data(bar_data)
     chart.set_title(title)
@@ -64,7 +50,7 @@ chart1 = dashboard.BarChart(
     row_index=0
 )
 chart1.set_title("Hotelling's T² Anomaly Scores")
-plot_histogram(data, 'hotelling_score', "Hotelling's T²", chart1)
+plot_histogram(histograms['hotelling'], "Hotelling's T²", chart1)
 
 # One-Class SVM
 chart2 = dashboard.BarChart(
@@ -72,7 +58,7 @@ chart2 = dashboard.BarChart(
     row_index=0
 )
 chart2.set_title("One-Class SVM Anomaly Scores")
-plot_histogram(data, 'ocsvm_score', 'One-Class SVM', chart2)
+plot_histogram(histograms['ocsvm'], 'One-Class SVM', chart2)
 
 # Isolation Forest
 chart3 = dashboard.BarChart(
@@ -80,7 +66,7 @@ chart3 = dashboard.BarChart(
     row_index=0
 )
 chart3.set_title("Isolation Forest Anomaly Scores")
-plot_histogram(data, 'iforest_score', 'Isolation Forest', chart3)
+plot_histogram(histograms['iforest'], 'Isolation Forest', chart3)
 
 # LOF
 chart4 = dashboard.BarChart(
@@ -88,7 +74,7 @@ chart4 = dashboard.BarChart(
     row_index=1
 )
 chart4.set_title("LOF Anomaly Scores")
-plot_histogram(data, 'lof_score', 'LOF', chart4)
+plot_histogram(histograms['lof'], 'LOF', chart4)
 
 # ChangeFinder
 chart5 = dashboard.BarChart(
@@ -96,6 +82,7 @@ chart5 = dashboard.BarChart(
     row_index=1
 )
 chart5.set_title("ChangeFinder Anomaly Scores")
-plot_histogram(data, 'cf_score', 'ChangeFinder', chart5)
+plot_histogram(histograms['changefinder'], 'ChangeFinder', chart5)
 
-dashboard.open()
+with stage('lightningchart:open'):
+    dashboard.open()
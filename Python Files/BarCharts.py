@@ -1,32 +1,25 @@
 # Bar Charts
-import lightningchart as lc
-import pandas as pd
-
-lc.set_license('my-license-key')
+from calendar_store import CalendarStore
+from compute import headless
+from instrumentation import stage
 
 file_path = 'machine_temperature_system_failure.csv'
-data = pd.read_csv(file_path)
-
-data['timestamp'] = pd.to_datetime(data['timestamp'])
-data['year'] = data['timestamp'].dt.year
-data['month'] = data['timestamp'].dt.month
+# per-month aggregates, kept on disk and only extended with readings added since the last run
+calendar = CalendarStore.for_file(file_path)
 
-count_data = data.groupby(['year', 'month']).size().unstack(fill_value=0)
+categories, data_count = calendar.bar_chart_data('count')
 
-mean_temp_data = data.groupby(['year', 'month'])['value'].mean().unstack(fill_value=0)
+_, data_temp = calendar.bar_chart_data('mean')
 
-max_temp_data = data.groupby(['year', 'month'])['value'].max().unstack(fill_value=0)
+_, data_max_temp = calendar.bar_chart_data('max')
 
-min_temp_data = data.groupby(['year', 'month'])['value'].min().unstack(fill_value=0)
+_, data_min_temp = calendar.bar_chart_data('min')
+# with --no-render the monthly aggregates go to results/bar_charts.npz and nothing is drawn
+headless('bar_charts', month=calendar.stats('month'))
 
-categories = count_data.index.astype(str).tolist()
-data_count = [{'subCategory': str(month), 'values': count_data[month].tolist()} for month in count_data.columns]
-
-data_temp = [{'subCategory': str(month), 'values': mean_temp_data[month].tolist()} for month in mean_temp_data.columns]
-
-data_max_temp = [{'subCategory': str(month), 'values': max_temp_data[month].tolist()} for month in max_temp_data.columns]
+import lightningchart as lc
 
-data_min_temp = [{'subCategory': str(month), 'values': min_temp_data[month].tolist()} for month in min_temp_data.columns]
+lc.set_license('my-license-key')
 
 dashboard = lc.Dashboard(rows=2, columns=2, theme=lc.Themes.Dark)
 
@@ -50,4 +43,5 @@ min_temp_chart.set_title('Year/Month Min Temperature')
 min_temp_chart.set_data_stacked(categories, data_min_temp)
 min_temp_chart.add_legend().add(min_temp_chart)
 
-dashboard.open()
+with stage('lightningchart:open'):
+    dashboard.open()
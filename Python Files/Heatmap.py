@@ -1,32 +1,33 @@
 # Heatmap Diagram
-import lightningchart as lc
-import pandas as pd
-
-lc.set_license('my-license-key')
+from compute import headless
+from data_loader import load_data
+from heatmap_grid import HeatmapGrid
+from instrumentation import stage
 
 file_path = 'machine_temperature_system_failure.csv'
-data = pd.read_csv(file_path)
+data = load_data(file_path)
 
-data['timestamp'] = pd.to_datetime(data['timestamp'])
-data['date'] = data['timestamp'].dt.strftime('%Y-%m-%d')
-data['time'] = data['timestamp'].dt.strftime('%H:%M:%S')
+# time-of-day slots x days, gaps filled with the mean of the per-slot means
+heatmap_grid = HeatmapGrid.from_arrays(data['timestamp_unix'].values, data['value'].values)
+# with --no-render the grid goes to results/heatmap.npz and nothing is drawn
+headless('heatmap', grid=heatmap_grid.grid, gaps=heatmap_grid.gaps, origin_ms=heatmap_grid.origin_ms)
 
-pivot_table = data.pivot_table(values='value', index='date', columns='time', aggfunc='mean')
-pivot_table = pivot_table.fillna(pivot_table.mean().mean())
-heatmap_data = pivot_table.values.T.tolist()
+import lightningchart as lc
+
+lc.set_license('my-license-key')
 
 chart = lc.ChartXY(
     theme=lc.Themes.Dark,
     title='Temperature & Given Anomaly Points',
 )
 
-series = chart.add_heatmap_grid_series(columns=len(heatmap_data), rows=len(heatmap_data[0]))
+series = chart.add_heatmap_grid_series(columns=heatmap_grid.n_slots, rows=heatmap_grid.n_days)
 
 series.set_step(x=1000 * 60 * 5, y=1000 * 60 * 60 * 24 * 2)
 
 series.hide_wireframe()
 series.set_intensity_interpolation(False)
-series.invalidate_intensity_values(heatmap_data)
+series.invalidate_intensity_values(heatmap_grid.grid)
 series.set_palette_colors(
     steps=[
         {'value': 0.0, 'color': lc.Color('blue')},
@@ -45,4 +46,5 @@ y_axis = chart.get_default_y_axis()
 y_axis.set_tick_strategy('DateTime', time_origin=data['timestamp'].min().timestamp() * 1000)
 y_axis.set_title('Date')
 
-chart.open()
+with stage('lightningchart:open'):
+    chart.open()
@@ -1,39 +1,36 @@
 # Time Series Analysis
-import lightningchart as lc
 import pandas as pd
-from datetime import datetime
-from scipy.stats import chi2
-
-lc.set_license('my-license-key')
+from compute import headless
+from data_loader import load_data
+from anomaly_labels import AnomalyWindows
+from pyramid import Pyramid, PyramidView
+from instrumentation import stage
 
 file_path = 'machine_temperature_system_failure.csv'
-data = pd.read_csv(file_path)
+data = load_data(file_path)
+# min/max/mean levels of the temperature, the chart starts on the coarsest level that fits
+pyramid = Pyramid.for_file(file_path)
 
-data['timestamp'] = pd.to_datetime(data['timestamp'])
+windows_path = 'anomaly_windows.json'
+anomaly_windows = AnomalyWindows.from_json(windows_path, series=file_path)
 
-anomaly_intervals = [
-    ["2013-12-10 06:25:00.000000", "2013-12-12 05:35:00.000000"],
-    ["2013-12-15 17:50:00.000000", "2013-12-17 17:00:00.000000"],
-    ["2014-01-27 14:20:00.000000", "2014-01-29 13:30:00.000000"],
-    ["2014-02-07 14:55:00.000000", "2014-02-09 14:05:00.000000"]
-]
-def is_anomaly(timestamp):
-    for start, end in anomaly_intervals:
-        if start <= timestamp <= end:
-            return True
-    return False
-
-data['anomaly'] = data['timestamp'].apply(lambda x: is_anomaly(x.strftime('%Y-%m-%d %H:%M:%S'))).astype(int)
+is_anomaly, interval_id = anomaly_windows.label(data['timestamp_unix'].values)
+data['anomaly'] = is_anomaly.astype(int)
+data['anomaly_window'] = interval_id
 anomalies = data[data['anomaly'] == 1].copy()
 normal_data = data[data['anomaly'] == 0]
 
-data['timestamp_unix'] = data['timestamp'].apply(lambda x: x.timestamp() * 1000)  # Convert to milliseconds
-anomalies['timestamp_unix'] = anomalies['timestamp'].apply(lambda x: x.timestamp() * 1000)  # Convert to milliseconds
-
 data['date'] = data['timestamp'].dt.date
 daily_mean = data.groupby('date')['value'].mean().reset_index()
 
 daily_mean['date_unix'] = pd.to_datetime(daily_mean['date']).apply(lambda x: x.timestamp() * 1000)
+# with --no-render the window labels and daily means go to results/time_series.npz and nothing is drawn
+headless('time_series', timestamp_ms=data['timestamp_unix'].values, anomaly=is_anomaly, anomaly_window=interval_id,
+         daily_ms=daily_mean['date_unix'].values, daily_mean=daily_mean['value'].values)
+
+import lightningchart as lc
+
+lc.set_license('my-license-key')
 
 dashboard = lc.Dashboard(
     rows=1,
@@ -42,9 +39,9 @@ dashboard = lc.Dashboard(
 )
 chart1 = dashboard.ChartXY(column_index=0, row_index=0)
 chart1.set_title('Temperature & Given Anomaly Points')
-temp_series = chart1.add_line_series()
-temp_series.add(data['timestamp_unix'].tolist(), data['value'].tolist())
-temp_series.set_name('Temperature')
+# call temperature_view.show(start, end) on a live dashboard to load finer tiles for a range
+temperature_view = PyramidView(chart1, pyramid, name='Temperature')
+temperature_view.show()
 
 anomaly_series = chart1.add_point_series()
 anomaly_series.add(anomalies['timestamp_unix'].tolist(), anomalies['value'].tolist())
@@ -78,4 +75,5 @@ y_axis2 = chart2.get_default_y_axis()
 y_axis2.set_title('Temperature')
 chart2.add_legend()
 
-dashboard.open()
+with stage('lightningchart:open'):
+    dashboard.open()
@@ -0,0 +1,54 @@
+# Ground-truth anomaly windows as a sorted int64 interval index
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def to_epoch_ms(timestamps):
+    return pd.to_datetime(pd.Series(timestamps)).values.astype('datetime64[ms]').astype(np.int64)
+
+
+class AnomalyWindows:
+    def __init__(self, intervals):
+        bounds = np.asarray([to_epoch_ms(list(pair)) for pair in intervals], dtype=np.int64).reshape(-1, 2)
+        order = np.argsort(bounds[:, 0], kind='stable')
+        self.starts = np.ascontiguousarray(bounds[order, 0])
+        self.ends = np.ascontiguousarray(bounds[order, 1])
+        # interval IDs follow the order the windows were given in, not the sorted order
+        self.ids = order
+        if np.any(self.ends < self.starts):
+            raise ValueError('anomaly window ends before it starts')
+        if np.any(self.starts[1:] <= self.ends[:-1]):
+            raise ValueError('anomaly windows overlap')
+
+    def __len__(self):
+        return len(self.starts)
+
+    @classmethod
+    def from_json(cls, path, series=None):
+        with open(path) as f:
+            windows = json.load(f)
+        if isinstance(windows, dict):
+            # NAB combined_windows.json style: {"<dir>/<file>.csv": [[start, end], ...]}
+            keys = [key for key in windows if series is None or key == series or os.path.basename(key) == os.path.basename(series)]
+            if len(keys) != 1:
+                raise KeyError(f'expected one window list for {series!r} in {path}, found {len(keys)}')
+            windows = windows[keys[0]]
+        return cls(windows)
+
+    def interval_ids(self, timestamps_ms):
+        # one searchsorted pass: the candidate window is the last one starting at or before t
+        timestamps_ms = np.asarray(timestamps_ms, dtype=np.int64)
+        if not len(self):
+            # NAB series without anomalies
+            return np.full(timestamps_ms.shape, -1, dtype=np.int64)
+        position = np.searchsorted(self.starts, timestamps_ms, side='right') - 1
+        inside = position >= 0
+        inside[inside] = timestamps_ms[inside] <= self.ends[position[inside]]
+        return np.where(inside, self.ids[np.maximum(position, 0)], -1)
+
+    def label(self, timestamps_ms):
+        ids = self.interval_ids(timestamps_ms)
+        return ids >= 0, ids
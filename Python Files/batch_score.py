@@ -0,0 +1,167 @@
+# Headless batch scoring of many sensor series
+# Discovers every CSV under a NAB-style data directory, scores each series with the configured
+# detectors on a process pool (one series per task) and writes scores and labels to one .npz per
+# series. A manifest records finished series, so a rerun after a crash only does what is left.
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from data_loader import parse_csv
+from detectors import DEFAULT_PARAMS, run_detector
+
+MANIFEST_NAME = 'manifest.jsonl'
+BATCH_VERSION = 1
+
+
+def discover(root, suffix='.csv'):
+    # {series id: path}; the id is the path below root without the suffix, e.g. realKnownCause/machine_temperature
+    series = {}
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if name.endswith(suffix):
+                path = os.path.join(directory, name)
+                series[os.path.relpath(path, root)[:-len(suffix)].replace(os.sep, '/')] = path
+    return dict(sorted(series.items()))
+
+
+def detector_config(names, overrides=None):
+    overrides = overrides or {}
+    return {name: {**DEFAULT_PARAMS[name], **overrides.get(name, {})} for name in names}
+
+
+def config_hash(config):
+    payload = json.dumps({'version': BATCH_VERSION, 'detectors': config}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def source_stamp(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def result_path(output, series_id):
+    return os.path.join(output, series_id + '.npz')
+
+
+def read_manifest(output):
+    # last entry per series; a line cut short by a crash is ignored
+    entries = {}
+    try:
+        with open(os.path.join(output, MANIFEST_NAME)) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                entries[entry['series']] = entry
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def append_manifest(output, entry):
+    with open(os.path.join(output, MANIFEST_NAME), 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def is_done(entry, path, output, series_id, digest):
+    return (entry is not None and entry.get('status') == 'done' and entry.get('config') == digest
+            and entry.get('source') == source_stamp(path) and os.path.exists(result_path(output, series_id)))
+
+
+def score_series(series_id, path, output, config):
+    start = time.perf_counter()
+    timestamps, values = parse_csv(path)
+    arrays = {'timestamp_ms': timestamps, 'value': values}
+    anomalies = {}
+    for name, params in config.items():
+        result = run_detector(name, values, **params)
+        arrays[f'{name}_score'] = np.asarray(result.scores, dtype=np.float64)
+        arrays[f'{name}_label'] = np.asarray(result.labels, dtype=bool)
+        anomalies[name] = int(np.count_nonzero(result.labels))
+    destination = result_path(output, series_id)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    tmp_path = f'{destination}.{os.getpid()}.tmp.npz'
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, destination)
+    return {'rows': len(values), 'seconds': time.perf_counter() - start, 'anomalies': anomalies}
+
+
+def load_result(output, series_id):
+    with np.load(result_path(output, series_id)) as stored:
+        return {name: stored[name] for name in stored.files}
+
+
+def run_batch(root, output, names, overrides=None, workers=None, resume=True, report=print):
+    os.makedirs(output, exist_ok=True)
+    config = detector_config(names, overrides)
+    digest = config_hash(config)
+    series = discover(root)
+    manifest = read_manifest(output) if resume else {}
+    pending = {sid: path for sid, path in series.items()
+               if not is_done(manifest.get(sid), path, output, sid, digest)}
+    report(f'{len(series)} series found, {len(series) - len(pending)} already scored, {len(pending)} to go')
+    # biggest files first so a long series does not start last and hold up the end of the run
+    order = sorted(pending, key=lambda sid: os.path.getsize(pending[sid]), reverse=True)
+
+    done = failed = points = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {pool.submit(score_series, sid, pending[sid], output, config): sid for sid in order}
+        for future in as_completed(futures):
+            sid = futures[future]
+            entry = {'series': sid, 'config': digest, 'source': source_stamp(pending[sid])}
+            try:
+                entry.update(future.result(), status='done')
+                done += 1
+                points += entry['rows']
+            except Exception as error:
+                entry.update(status='failed', error=f'{type(error).__name__}: {error}')
+                failed += 1
+            append_manifest(output, entry)
+            elapsed = time.perf_counter() - start
+            report(f'[{done + failed}/{len(order)}] {sid}: {entry["status"]}'
+                   f' ({done / elapsed:.2f} series/s, {points / elapsed:,.0f} points/s)')
+    elapsed = time.perf_counter() - start
+    summary = {
+        'series': done, 'failed': failed, 'skipped': len(series) - len(pending), 'points': points,
+        'seconds': elapsed,
+        'series_per_s': done / elapsed if elapsed else 0.0,
+        'points_per_s': points / elapsed if elapsed else 0.0,
+    }
+    report(f"scored {done} series ({points:,} points) in {elapsed:.1f} s: "
+           f"{summary['series_per_s']:.2f} series/s, {summary['points_per_s']:,.0f} points/s, {failed} failed")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score every sensor series under a directory.')
+    parser.add_argument('root', help='directory searched recursively for CSV files')
+    parser.add_argument('--output', default='scores', help='results store directory')
+    parser.add_argument('--detectors', default=','.join(DEFAULT_PARAMS),
+                        help='comma separated, from ' + ', '.join(DEFAULT_PARAMS))
+    parser.add_argument('--ocsvm-mode', default='nystroem', choices=['exact', 'nystroem', 'sample'],
+                        help="One-Class SVM fit, see ocsvm_approx.py; 'exact' is quadratic in the series length")
+    parser.add_argument('--lof-mode', default='sorted', choices=['exact', 'sorted'],
+                        help="LOF fit, 'sorted' is lof_1d.py's faster 1-D LOF")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--restart', action='store_true', help='ignore the manifest and score everything again')
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.detectors.split(',') if name.strip()]
+    unknown = sorted(set(names) - set(DEFAULT_PARAMS))
+    if unknown:
+        parser.error(f'unknown detectors: {", ".join(unknown)}')
+    overrides = {'ocsvm': {'mode': args.ocsvm_mode}, 'lof': {'mode': args.lof_mode}}
+    run_batch(args.root, args.output, names, overrides, args.workers, not args.restart)
+
+
+if __name__ == '__main__':
+    main()
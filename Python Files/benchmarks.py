@@ -0,0 +1,290 @@
+# Benchmark suite for loading, detectors and chart preparation
+# Every case runs on synthetic temperature series of growing length and records wall time and the
+# tracemalloc peak, without opening any chart. Results go to a JSON file, and two result files can
+# be compared to catch regressions between commits.
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+
+import numpy as np
+
+from data_loader import CACHE_DIR_NAME, load_arrays, parse_csv
+from detectors import run_detector
+from result_cache import library_versions
+
+DEFAULT_SIZES = (20_000, 100_000, 1_000_000, 10_000_000)
+DEFAULT_DIRECTORY = os.path.join(CACHE_DIR_NAME, 'bench')
+READING_MS = 5 * 60 * 1000
+# a case that already took this long is not repeated
+REPEAT_BUDGET_S = 1.0
+
+# setup(series) prepares the inputs outside the timing and returns the zero-argument call to time;
+# max_n skips sizes a case cannot finish in reasonable time (ignored with --all-sizes)
+Case = namedtuple('Case', ['setup', 'max_n'])
+Series = namedtuple('Series', ['timestamps', 'values', 'csv_path', 'directory'])
+
+
+def synthetic_series(n, seed=0):
+    # 5-minute readings around 85 degrees with a daily cycle, slow drift, noise and a few failures,
+    # which dip the temperature for a few hours like the drops in the machine temperature data
+    rng = np.random.default_rng(seed)
+    timestamps = np.datetime64('2013-12-02', 'ms').astype(np.int64) + READING_MS * np.arange(n, dtype=np.int64)
+    day = (timestamps % 86_400_000) / 86_400_000
+    values = 85 + 3 * np.sin(2 * np.pi * day) + np.cumsum(rng.normal(0, 0.05, n)) * 0.1 + rng.normal(0, 1.0, n)
+    for start in rng.integers(0, n, max(1, n // 20_000)):
+        values[start:start + 48] -= rng.uniform(20, 60)
+    return timestamps, values
+
+
+def write_csv(path, timestamps, values, chunk=1_000_000):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write('timestamp,value\n')
+        for i in range(0, len(values), chunk):
+            stamps = timestamps[i:i + chunk].astype('datetime64[ms]').astype('datetime64[s]').astype(str)
+            text = np.char.add(np.char.add(np.char.replace(stamps, 'T', ' '), ','),
+                               np.char.mod('%.6f', values[i:i + chunk]))
+            f.write('\n'.join(text.tolist()))
+            f.write('\n')
+    os.replace(tmp_path, path)
+
+
+def make_series(n, directory, seed=0):
+    # the CSV is kept between runs, writing 10M rows takes longer than most of the cases
+    timestamps, values = synthetic_series(n, seed)
+    series_dir = os.path.join(directory, f'synthetic_{n}_{seed}')
+    os.makedirs(series_dir, exist_ok=True)
+    csv_path = os.path.join(series_dir, 'series.csv')
+    if not os.path.exists(csv_path):
+        write_csv(csv_path, timestamps, values)
+    return Series(timestamps, values, csv_path, series_dir)
+
+
+def _parse_csv(series):
+    return lambda: parse_csv(series.csv_path)
+
+
+def _load_cached(series):
+    cache_dir = os.path.join(series.directory, CACHE_DIR_NAME)
+    load_arrays(series.csv_path, cache_dir=cache_dir)
+    return lambda: load_arrays(series.csv_path, cache_dir=cache_dir)
+
+
+def _detector(name, **params):
+    def setup(series):
+        return lambda: run_detector(name, series.values, **params)
+    return setup
+
+
+def _kde(series):
+    from binned_kde import grouped_kde
+
+    # one curve per calendar month, as in AreaCharts.py
+    months = series.timestamps.astype('datetime64[ms]').astype('datetime64[M]').astype(np.int64) % 12
+    x_eval = np.linspace(series.values.min(), series.values.max(), 100)
+    return lambda: grouped_kde(series.values, months, x_eval)
+
+
+def _heatmap(series):
+    from heatmap_grid import HeatmapGrid
+
+    return lambda: HeatmapGrid.from_arrays(series.timestamps, series.values)
+
+
+def _calendar(series):
+    from calendar_store import CalendarStore
+
+    def run():
+        store = CalendarStore()
+        store.add(series.timestamps, series.values)
+        return store.bar_chart_data('mean')
+    return run
+
+
+def _sketch(series):
+    from sketches import score_summary
+
+    # histogram and quantile sketch as the score bar charts build them
+    return lambda: score_summary(series.values)
+
+
+def _series_full(series):
+    # what series.add() receives when every reading is drawn
+    x = series.timestamps.astype(np.float64)
+    return lambda: (x.tolist(), series.values.tolist())
+
+
+def _series_decimated(series, max_points=4000):
+    from decimation import decimate
+
+    x = series.timestamps.astype(np.float64)
+
+    def run():
+        shown = decimate(x, series.values, max_points)
+        return x[shown].tolist(), series.values[shown].tolist()
+    return run
+
+
+CASES = {
+    'load:parse_csv': Case(_parse_csv, None),
+    'load:cached': Case(_load_cached, None),
+    'detector:hotelling': Case(_detector('hotelling'), None),
+    'detector:variance': Case(_detector('variance'), None),
+    'detector:changefinder': Case(_detector('changefinder'), None),
+    'detector:iforest': Case(_detector('iforest'), 1_000_000),
+    # the exact fits are quadratic in the series length
+    'detector:lof': Case(_detector('lof'), 20_000),
+    'detector:lof_sorted': Case(_detector('lof', mode='sorted'), 1_000_000),
+    'detector:ocsvm': Case(_detector('ocsvm'), 20_000),
+    'detector:ocsvm_nystroem': Case(_detector('ocsvm', mode='nystroem'), 100_000),
+    'kde:grouped': Case(_kde, None),
+    'heatmap:grid': Case(_heatmap, None),
+    'calendar:aggregate': Case(_calendar, None),
+    'sketch:score_summary': Case(_sketch, None),
+    'series:full_tolist': Case(_series_full, None),
+    'series:decimated': Case(_series_decimated, None),
+}
+
+
+def select_cases(patterns):
+    # a pattern matches case names starting with it, 'detector:' selects every detector
+    if not patterns:
+        return list(CASES)
+    return [name for name in CASES if any(name.startswith(pattern) for pattern in patterns)]
+
+
+def measure(run, repeats=3, memory=True):
+    timings = []
+    for _ in range(repeats):
+        began = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - began)
+        if timings[-1] >= REPEAT_BUDGET_S:
+            break
+    peak = None
+    if memory:
+        # separate run, tracemalloc slows allocation-heavy code down too much to time it as well
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {'runs': len(timings), 'best_s': min(timings), 'median_s': statistics.median(timings), 'peak_bytes': peak}
+
+
+def warm_up(names, directory):
+    # imports, Numba compilation and first-touch costs are paid here instead of in the smallest size
+    series = make_series(2_000, directory)
+    for name in names:
+        CASES[name].setup(series)()
+
+
+def run_suite(sizes=DEFAULT_SIZES, names=None, directory=DEFAULT_DIRECTORY, repeats=3, memory=True,
+              all_sizes=False, report=print):
+    names = names or list(CASES)
+    os.makedirs(directory, exist_ok=True)
+    warm_up(names, directory)
+    results = []
+    for n in sizes:
+        series = make_series(n, directory)
+        for name in names:
+            case = CASES[name]
+            if case.max_n is not None and n > case.max_n and not all_sizes:
+                continue
+            row = {'case': name, 'n': n, **measure(case.setup(series), repeats, memory)}
+            row['points_per_s'] = n / row['best_s'] if row['best_s'] else None
+            results.append(row)
+            report(format_row(row))
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'libraries': library_versions(),
+        'repeats': repeats,
+        'results': results,
+    }
+
+
+def format_row(row):
+    peak = '' if row['peak_bytes'] is None else f"{row['peak_bytes'] / 2 ** 20:>10.1f} MiB"
+    return f"{row['case']:<26}{row['n']:>11,}{row['best_s'] * 1000:>12.1f} ms{row['points_per_s']:>16,.0f} pts/s{peak}"
+
+
+def compare(before, after, tolerance=0.10, report=print):
+    # returns the (case, n) pairs that got slower by more than tolerance
+    old = {(row['case'], row['n']): row for row in before['results']}
+    regressions = []
+    report(f"{'case':<26}{'n':>11}{'before ms':>12}{'after ms':>12}{'ratio':>8}{'peak ratio':>12}")
+    for row in after['results']:
+        key = (row['case'], row['n'])
+        if key not in old:
+            continue
+        ratio = row['best_s'] / old[key]['best_s']
+        peak_ratio = ''
+        if row['peak_bytes'] and old[key]['peak_bytes']:
+            peak_ratio = f"{row['peak_bytes'] / old[key]['peak_bytes']:>12.2f}"
+        flag = '  slower' if ratio > 1 + tolerance else '  faster' if ratio < 1 - tolerance else ''
+        report(f'{key[0]:<26}{key[1]:>11,}{old[key]["best_s"] * 1000:>12.1f}{row["best_s"] * 1000:>12.1f}'
+               f'{ratio:>8.2f}{peak_ratio}{flag}')
+        if ratio > 1 + tolerance:
+            regressions.append(key)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time loading, detectors and chart preparation.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='run the suite and write the results as JSON')
+    run.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    run.add_argument('--cases', nargs='+', help='case name prefixes, e.g. detector: kde:grouped')
+    run.add_argument('--repeats', type=int, default=3)
+    run.add_argument('--no-memory', action='store_true', help='skip the tracemalloc peak run')
+    run.add_argument('--all-sizes', action='store_true', help='also run cases above their size limit')
+    run.add_argument('--directory', default=DEFAULT_DIRECTORY, help='where synthetic CSVs are kept')
+    run.add_argument('--output', help='results file, default bench-<timestamp>.json')
+
+    compare_cmd = commands.add_parser('compare', help='compare two result files')
+    compare_cmd.add_argument('before')
+    compare_cmd.add_argument('after')
+    compare_cmd.add_argument('--tolerance', type=float, default=0.10, help='allowed slowdown, 0.10 is 10%%')
+
+    commands.add_parser('list', help='list the cases')
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        for name, case in CASES.items():
+            print(f"{name:<26}{'' if case.max_n is None else f'up to {case.max_n:,} points'}")
+        return
+    if args.command == 'compare':
+        with open(args.before) as f:
+            before = json.load(f)
+        with open(args.after) as f:
+            after = json.load(f)
+        regressions = compare(before, after, args.tolerance)
+        if regressions:
+            print(f'{len(regressions)} regressions over {args.tolerance:.0%}')
+            sys.exit(1)
+        return
+
+    names = select_cases(args.cases)
+    if not names:
+        parser.error(f'no case matches {args.cases}, see the list command')
+    results = run_suite(sorted(args.sizes), names, args.directory, args.repeats, not args.no_memory, args.all_sizes)
+    output = args.output or time.strftime('bench-%Y%m%d-%H%M%S.json')
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
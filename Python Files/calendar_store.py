@@ -0,0 +1,148 @@
+# Persistent per-month aggregates for the calendar bar charts
+# Every month bucket keeps count, sum, sum of squares, min and max, so count, mean, std, min and
+# max all come from one pass over the readings. Buckets merge by key, which is how new readings
+# are folded in and how quarters and years roll up from months without touching raw data.
+import os
+
+import numpy as np
+
+from data_loader import cache_dir_for, cache_meta, load_arrays
+from instrumentation import timed
+from result_cache import data_fingerprint
+
+STORE_VERSION = 2
+FIELDS = ('count', 'total', 'squares', 'low', 'high')
+# months per bucket of each level; keys are months since 1970-01
+LEVELS = {'month': 1, 'quarter': 3, 'year': 12}
+
+
+def month_keys(timestamps):
+    return np.asarray(timestamps, dtype=np.int64).astype('datetime64[ms]').astype('datetime64[M]').astype(np.int64)
+
+
+def _reduce(keys, count, total, squares, low, high):
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    return {
+        'key': keys[starts],
+        'count': np.add.reduceat(count[order], starts),
+        'total': np.add.reduceat(total[order], starts),
+        'squares': np.add.reduceat(squares[order], starts),
+        'low': np.minimum.reduceat(low[order], starts),
+        'high': np.maximum.reduceat(high[order], starts),
+    }
+
+
+def aggregate(timestamps, values):
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        empty = {field: np.zeros(0) for field in FIELDS}
+        return {**empty, 'key': np.zeros(0, dtype=np.int64), 'count': np.zeros(0, dtype=np.int64)}
+    return _reduce(month_keys(timestamps), np.ones(len(values), dtype=np.int64), values, values * values, values, values)
+
+
+def merge(a, b):
+    return _reduce(*(np.concatenate((a[field], b[field])) for field in ('key',) + FIELDS))
+
+
+def prefix_fingerprint(timestamps, values, rows):
+    # both columns, so corrected readings under unchanged timestamps are noticed too
+    return data_fingerprint(timestamps[:rows]) + data_fingerprint(np.asarray(values[:rows], dtype=np.float64))
+
+
+class CalendarStore:
+    def __init__(self, buckets=None, rows=0, fingerprint=None, source=None):
+        self.buckets = buckets if buckets is not None else aggregate([], [])
+        # how many leading rows of the source are merged, and their fingerprint
+        self.rows = rows
+        self.fingerprint = fingerprint
+        # for_file: the CSV cache's sha1 and size when the store was last synced
+        self.source = source
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as stored:
+            if int(stored['version']) != STORE_VERSION:
+                raise ValueError('calendar store was written by another version')
+            buckets = {field: stored[field] for field in ('key',) + FIELDS}
+            return cls(buckets, int(stored['rows']), str(stored['fingerprint']), str(stored['source']))
+
+    def save(self, path):
+        tmp_path = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(tmp_path, version=STORE_VERSION, rows=self.rows, fingerprint=str(self.fingerprint),
+                 source=str(self.source), **self.buckets)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    @timed('calendar_store')
+    def for_file(cls, file_path, cache_dir=None):
+        # the store next to the CSV's binary cache, brought up to date with the file; an unchanged
+        # file is recognised from the cache meta without reading the data
+        path = os.path.join(cache_dir_for(file_path, cache_dir), 'calendar.npz')
+        meta = cache_meta(file_path, cache_dir)
+        source = f"{meta['sha1']}:{meta['size']}"
+        try:
+            store = cls.load(path)
+        except (OSError, KeyError, ValueError):
+            store = cls()
+        if store.source == source:
+            return store
+        timestamps, values = load_arrays(file_path, cache_dir=cache_dir)
+        store.sync(timestamps, values)
+        store.source = source
+        store.save(path)
+        return store
+
+    def add(self, timestamps, values):
+        self.buckets = merge(self.buckets, aggregate(timestamps, values))
+        self.rows += len(values)
+
+    def sync(self, timestamps, values):
+        # merges rows appended since the last sync; rebuilds if the rows already merged changed.
+        # Returns whether anything changed.
+        if self.rows <= len(values) and self.fingerprint == prefix_fingerprint(timestamps, values, self.rows):
+            if self.rows == len(values):
+                return False
+            start = self.rows
+        else:
+            self.buckets, self.rows, start = aggregate([], []), 0, 0
+        self.add(timestamps[start:], values[start:])
+        self.fingerprint = prefix_fingerprint(timestamps, values, self.rows)
+        return True
+
+    def rollup(self, level='month'):
+        months = LEVELS[level]
+        if months == 1:
+            return self.buckets
+        return _reduce(self.buckets['key'] // months, *(self.buckets[field] for field in FIELDS))
+
+    def stats(self, level='month'):
+        buckets = self.rollup(level)
+        count = buckets['count']
+        mean = buckets['total'] / count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            variance = np.maximum(buckets['squares'] - buckets['total'] * mean, 0.0) / (count - 1)
+        return {
+            'key': buckets['key'],
+            'count': count,
+            'mean': mean,
+            'std': np.sqrt(variance),
+            'min': buckets['low'],
+            'max': buckets['high'],
+        }
+
+    def bar_chart_data(self, stat):
+        # categories are years, one stacked sub-category per month seen; missing months are 0,
+        # the same layout as groupby(['year', 'month']).<stat>().unstack(fill_value=0)
+        table = self.stats('month')
+        years = table['key'] // 12 + 1970
+        months = table['key'] % 12 + 1
+        year_labels, year_index = np.unique(years, return_inverse=True)
+        month_labels, month_index = np.unique(months, return_inverse=True)
+        grid = np.zeros((len(year_labels), len(month_labels)), dtype=table[stat].dtype)
+        grid[year_index, month_index] = table[stat]
+        categories = [str(year) for year in year_labels.tolist()]
+        return categories, [
+            {'subCategory': str(month), 'values': grid[:, i].tolist()} for i, month in enumerate(month_labels.tolist())
+        ]
@@ -0,0 +1,235 @@
+# Compiled ChangeFinder scoring kernel
+# Same two-stage SDAR + smoothing as changefinder.ChangeFinder, but run over a whole
+# NumPy array in one call. Numba is optional; without it the same loop runs as Python.
+import math
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        def wrap(func):
+            return func
+        return wrap
+
+# counters layout
+N_TERM, N_FIRST, FIRST_POS, N_SMOOTHED, N_SECOND, SECOND_POS = range(6)
+
+
+@njit(cache=True)
+def _levinson_durbin(sdar, stage, order, a, scratch):
+    # autocovariances c_k live at sdar[stage, 2 + k]
+    a[0] = 1.0
+    a[1] = -sdar[stage, 3] / sdar[stage, 2]
+    e = sdar[stage, 2] + sdar[stage, 3] * a[1]
+    for k in range(1, order):
+        lam = 0.0
+        for j in range(k + 1):
+            lam -= a[j] * sdar[stage, 3 + k - j]
+        lam /= e
+        a[k + 1] = 0.0
+        for i in range(k + 2):
+            scratch[i] = a[i]
+        for i in range(k + 2):
+            a[i] = scratch[i] + lam * scratch[k + 1 - i]
+        e *= 1.0 - lam * lam
+
+
+@njit(cache=True)
+def _sdar_update(sdar, stage, r, order, x, term, a, scratch):
+    # sdar[stage] = [mu, sigma, c_0 .. c_order]; term holds the previous `order` inputs, oldest first
+    mu = (1 - r) * sdar[stage, 0] + r * x
+    sdar[stage, 0] = mu
+    for i in range(1, order):
+        sdar[stage, 2 + i] = (1 - r) * sdar[stage, 2 + i] + r * (x - mu) * (term[order - i] - mu)
+    sdar[stage, 2] = (1 - r) * sdar[stage, 2] + r * (x - mu) * (x - mu)
+    _levinson_durbin(sdar, stage, order, a, scratch)
+    xhat = mu
+    for j in range(order):
+        xhat -= a[j + 1] * (term[order - 1 - j] - mu)
+    sigma = (1 - r) * sdar[stage, 1] + r * (x - xhat) * (x - xhat)
+    sdar[stage, 1] = sigma
+    return 0.5 * (x - xhat) ** 2 / sigma + 0.5 * math.log(2 * math.pi * sigma)
+
+
+@njit(cache=True)
+def _push(window, x, order):
+    for i in range(order - 1):
+        window[i] = window[i + 1]
+    window[order - 1] = x
+
+
+@njit(cache=True)
+def _changefinder_kernel(values, r, order, sdar, term, first, second, smoothed, counters, sums, out):
+    smooth = first.shape[0]
+    smooth2 = second.shape[0]
+    a = np.zeros(order + 1)
+    scratch = np.zeros(order + 1)
+    # work on locals and write the counters back once at the end
+    n_term, n_first, first_pos, n_smoothed, n_second, second_pos = counters
+    first_sum, second_sum = sums
+    first_ready = -1
+    for n in range(values.shape[0]):
+        x = values[n]
+        if n_term == order:
+            score = _sdar_update(sdar, 0, r, order, x, term, a, scratch)
+            first_sum += score - first[first_pos]
+            first[first_pos] = score
+            first_pos += 1
+            if first_pos == smooth:
+                # re-add the window exactly once per lap so the running sum cannot drift
+                first_pos = 0
+                first_sum = first.sum()
+            if n_first < smooth:
+                n_first += 1
+        else:
+            n_term += 1
+        _push(term, x, order)
+
+        if n_first == smooth and first_sum != 0.0:
+            if n_smoothed == order:
+                score = _sdar_update(sdar, 1, r, order, first_sum, smoothed, a, scratch)
+                second_sum += score - second[second_pos]
+                second[second_pos] = score
+                second_pos += 1
+                if second_pos == smooth2:
+                    second_pos = 0
+                    second_sum = second.sum()
+                if n_second < smooth2:
+                    n_second += 1
+            else:
+                n_smoothed += 1
+            _push(smoothed, first_sum, order)
+
+        if n_second == smooth2:
+            out[n] = second_sum
+            if first_ready < 0:
+                first_ready = n
+        else:
+            out[n] = 0.0
+    counters[:] = (n_term, n_first, first_pos, n_smoothed, n_second, second_pos)
+    sums[0] = first_sum
+    sums[1] = second_sum
+    return first_ready
+
+
+@njit(cache=True)
+def _sdar_order1(mu, sigma, c0, r, x, prev):
+    # order-1 SDAR with the state in registers; c_1 is never updated by changefinder,
+    # so the AR coefficient is -0 / c_0 and the prediction collapses to mu
+    mu = (1 - r) * mu + r * x
+    c0 = (1 - r) * c0 + r * (x - mu) * (x - mu)
+    xhat = mu + (0.0 / c0) * (prev - mu)
+    sigma = (1 - r) * sigma + r * (x - xhat) * (x - xhat)
+    return mu, sigma, c0, 0.5 * (x - xhat) ** 2 / sigma + 0.5 * math.log(2 * math.pi * sigma)
+
+
+@njit(cache=True)
+def _changefinder_kernel_order1(values, r, sdar, term, first, second, smoothed, counters, sums, out):
+    smooth = first.shape[0]
+    smooth2 = second.shape[0]
+    mu1, sigma1, c1 = sdar[0, 0], sdar[0, 1], sdar[0, 2]
+    mu2, sigma2, c2 = sdar[1, 0], sdar[1, 1], sdar[1, 2]
+    prev, prev_target = term[0], smoothed[0]
+    n_term, n_first, first_pos, n_smoothed, n_second, second_pos = counters
+    first_sum, second_sum = sums
+    first_ready = -1
+    for n in range(values.shape[0]):
+        x = values[n]
+        if n_term == 1:
+            mu1, sigma1, c1, score = _sdar_order1(mu1, sigma1, c1, r, x, prev)
+            first_sum += score - first[first_pos]
+            first[first_pos] = score
+            first_pos += 1
+            if first_pos == smooth:
+                first_pos = 0
+                first_sum = first.sum()
+            if n_first < smooth:
+                n_first += 1
+        else:
+            n_term = 1
+        prev = x
+
+        if n_first == smooth and first_sum != 0.0:
+            if n_smoothed == 1:
+                mu2, sigma2, c2, score = _sdar_order1(mu2, sigma2, c2, r, first_sum, prev_target)
+                second_sum += score - second[second_pos]
+                second[second_pos] = score
+                second_pos += 1
+                if second_pos == smooth2:
+                    second_pos = 0
+                    second_sum = second.sum()
+                if n_second < smooth2:
+                    n_second += 1
+            else:
+                n_smoothed = 1
+            prev_target = first_sum
+
+        if n_second == smooth2:
+            out[n] = second_sum
+            if first_ready < 0:
+                first_ready = n
+        else:
+            out[n] = 0.0
+    sdar[0, 0], sdar[0, 1], sdar[0, 2] = mu1, sigma1, c1
+    sdar[1, 0], sdar[1, 1], sdar[1, 2] = mu2, sigma2, c2
+    term[0], smoothed[0] = prev, prev_target
+    counters[:] = (n_term, n_first, first_pos, n_smoothed, n_second, second_pos)
+    sums[0] = first_sum
+    sums[1] = second_sum
+    return first_ready
+
+
+class ChangeFinderState:
+    def __init__(self, r=0.002, order=1, smooth=250, rng=None):
+        if order < 1:
+            raise ValueError('order must be 1 or more.')
+        if smooth < 3:
+            raise ValueError('smooth must be 3 or more.')
+        self.r = float(r)
+        self.order = int(order)
+        # draw the SDAR starting points in the order changefinder does, from the
+        # legacy global generator by default, so np.random.seed() reproduces it
+        draw = np.random.random if rng is None else rng.random
+        self.sdar = np.zeros((2, order + 3))
+        for stage in range(2):
+            self.sdar[stage, 0] = draw()
+            self.sdar[stage, 1] = draw()
+        self.term = np.zeros(order)
+        self.smoothed = np.zeros(order)
+        self.first = np.zeros(smooth)
+        self.second = np.zeros(int(round(smooth / 2.0)))
+        self.counters = np.zeros(6, dtype=np.int64)
+        self.sums = np.zeros(2)
+
+    @property
+    def ready(self):
+        return self.counters[N_SECOND] == len(self.second)
+
+    def update(self, values):
+        # scores for `values`, continuing from wherever the previous call stopped;
+        # also returns the index of the first real score (-1 if none yet)
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        out = np.empty(len(values))
+        if self.order == 1:
+            first_ready = _changefinder_kernel_order1(
+                values, self.r, self.sdar, self.term, self.first, self.second,
+                self.smoothed, self.counters, self.sums, out,
+            )
+        else:
+            first_ready = _changefinder_kernel(
+                values, self.r, self.order, self.sdar, self.term, self.first, self.second,
+                self.smoothed, self.counters, self.sums, out,
+            )
+        return out, first_ready
+
+
+def warm_up(order=1):
+    # loads (or compiles) the kernel for this order up front, so a live stream's first batch does not wait for it
+    ChangeFinderState(order=order, smooth=3, rng=np.random.default_rng(0)).update(np.zeros(8))
+
+
+def changefinder_scores(values, r=0.002, order=1, smooth=250, rng=None):
+    scores, _ = ChangeFinderState(r, order, smooth, rng).update(values)
+    return scores
@@ -0,0 +1,177 @@
+# Chart-free compute layer behind the dashboards
+# Scores, labels and aggregates without lightningchart. The scripts compute first and only import
+# the charting library afterwards; started with --no-render they write their numbers to disk and
+# stop before it. pandas, scikit-learn, scipy and numba load inside the functions that use them,
+# and `python compute.py imports` checks that importing this module stays within IMPORT_BUDGET_S.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from data_loader import load_arrays
+
+DEFAULT_FILE = 'machine_temperature_system_failure.csv'
+DEFAULT_OUTPUT = 'results'
+IMPORT_BUDGET_S = 0.3
+# none of these may be loaded by `import compute`
+HEAVY_MODULES = ('lightningchart', 'pandas', 'sklearn', 'scipy', 'numba', 'joblib', 'changefinder')
+
+
+def render_options(argv=None):
+    # the scripts take no other arguments, unknown ones are left alone
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--no-render', action='store_true')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    # comma separated panel names, for the scripts built from panels
+    parser.add_argument('--panels')
+    options, _ = parser.parse_known_args(sys.argv[1:] if argv is None else argv)
+    return options
+
+
+def detector_results(values, jobs=None, cache=True):
+    # {label: DetectorResult}, fitted in parallel and memoized on disk
+    from detector_runner import run_detectors
+    from result_cache import ResultCache
+
+    return run_detectors(values, jobs, cache=ResultCache() if cache is True else cache or None)
+
+
+def _flatten(arrays, results=None):
+    flat = {}
+    for label, result in (results or {}).items():
+        flat[f'{label}_score'] = np.asarray(result.scores)
+        flat[f'{label}_label'] = np.asarray(result.labels, dtype=bool)
+    for name, value in arrays.items():
+        if isinstance(value, dict):
+            for key, item in value.items():
+                flat[f'{name}_{key}'] = np.asarray(item)
+        else:
+            flat[name] = np.asarray(value)
+    return flat
+
+
+def write_results(path, results=None, **arrays):
+    # one .npz: <label>_score and <label>_label per detector, dicts of arrays as <name>_<key>
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp.npz'
+    np.savez(tmp_path, **_flatten(arrays, results))
+    os.replace(tmp_path, path)
+    return path
+
+
+def headless(name, results=None, **arrays):
+    # with --no-render, writes <output>/<name>.npz and ends the script before anything is drawn
+    options = render_options()
+    if not options.no_render:
+        return
+    path = write_results(os.path.join(options.output, name + '.npz'), results, **arrays)
+    print(f'results written to {path}')
+    sys.exit(0)
+
+
+def calendar_parts(timestamps):
+    # (year, month) of epoch-ms timestamps without going through pandas
+    months = np.asarray(timestamps, dtype=np.int64).astype('datetime64[ms]').astype('datetime64[M]').astype(np.int64)
+    return months // 12 + 1970, months % 12 + 1
+
+
+def kde_curves(values, timestamps, points=100):
+    # the AreaCharts densities: all readings, per year and per month, on one grid
+    from binned_kde import grouped_kde, kde
+
+    years, months = calendar_parts(timestamps)
+    x = np.linspace(values.min(), values.max(), points)
+    return x, kde(values, x), grouped_kde(values, years, x), grouped_kde(values, months, x)
+
+
+def compute_all(file_path=DEFAULT_FILE, jobs=None, cache=True):
+    # everything the dashboards show, as plain arrays
+    from calendar_store import CalendarStore
+    from heatmap_grid import HeatmapGrid
+
+    timestamps, values = load_arrays(file_path)
+    arrays = {'timestamp_ms': timestamps, 'value': values}
+    results = detector_results(values, jobs, cache)
+    if 'changefinder' in results:
+        from detectors import DEFAULT_PARAMS, changefinder_threshold
+
+        arrays['changefinder_threshold'] = changefinder_threshold(
+            results['changefinder'].scores, DEFAULT_PARAMS['changefinder']['iqr_factor'])
+    arrays['calendar'] = CalendarStore.for_file(file_path).stats('month')
+    grid = HeatmapGrid.from_arrays(timestamps, values)
+    arrays['heatmap_grid'] = grid.grid
+    arrays['heatmap_origin_ms'] = grid.origin_ms
+    arrays['kde_x'], arrays['kde_all'], arrays['kde_year'], arrays['kde_month'] = kde_curves(values, timestamps)
+    return results, arrays
+
+
+def import_time(module='compute'):
+    # cumulative import time of module in a fresh interpreter, plus the heavy modules it pulled in
+    code = f'import json, sys, {module}; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))'
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [here, os.environ.get('PYTHONPATH')]))}
+    run = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                         capture_output=True, text=True, env=env, check=True)
+    # stderr lines "import time: self [us] | cumulative | imported package", children are indented
+    # and listed before their parent
+    total, top, children = 0, [], []
+    for line in run.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name[1:].rstrip()
+        if not name.startswith(' '):
+            if name == module:
+                total, top = int(cumulative), sorted(children, key=lambda row: -row[1])
+            children = []
+        elif not name.startswith('   '):
+            children.append((name.strip(), int(cumulative)))
+    return total / 1e6, json.loads(run.stdout), top
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compute the dashboard numbers without rendering.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='score and aggregate a CSV, write one .npz')
+    run.add_argument('csv', nargs='?', default=DEFAULT_FILE)
+    run.add_argument('--output', default=os.path.join(DEFAULT_OUTPUT, 'compute.npz'))
+    run.add_argument('--detectors', help='comma separated, default all')
+    run.add_argument('--ocsvm-mode', default='exact', choices=['exact', 'nystroem', 'sample'])
+    run.add_argument('--lof-mode', default='exact', choices=['exact', 'sorted'])
+    run.add_argument('--no-cache', action='store_true', help='refit instead of reusing cached detector results')
+
+    imports = commands.add_parser('imports', help='check the import time budget')
+    imports.add_argument('--module', default='compute')
+    imports.add_argument('--budget', type=float, default=IMPORT_BUDGET_S, help='seconds')
+    args = parser.parse_args(argv)
+
+    if args.command == 'imports':
+        seconds, heavy, top = import_time(args.module)
+        print(f'import {args.module}: {seconds * 1000:.0f} ms (budget {args.budget * 1000:.0f} ms)')
+        for name, cumulative in top[:8]:
+            print(f'  {name:<30}{cumulative / 1000:>8.1f} ms')
+        if heavy:
+            print(f"heavy modules loaded at import: {', '.join(heavy)}")
+        if heavy or seconds > args.budget:
+            sys.exit(1)
+        return
+
+    from detectors import DEFAULT_PARAMS
+
+    names = args.detectors.split(',') if args.detectors else list(DEFAULT_PARAMS)
+    modes = {'ocsvm': args.ocsvm_mode, 'lof': args.lof_mode}
+    jobs = {name: (name, {'mode': modes[name]} if name in modes else {}) for name in names}
+    began = time.perf_counter()
+    results, arrays = compute_all(args.csv, jobs, cache=not args.no_cache)
+    write_results(args.output, results, **arrays)
+    print(f"{len(arrays['value'])} readings, {len(results)} detectors in {time.perf_counter() - began:.1f} s, "
+          f'written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
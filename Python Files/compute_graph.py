@@ -0,0 +1,64 @@
+# Lazy dependency graph for dashboard computations
+# Nodes are named functions of other nodes. evaluate(targets) runs only the nodes the targets
+# reach, each at most once (values are kept for later calls), and hands every node to a thread
+# pool as soon as its inputs are ready, so independent detectors, KDEs and aggregates overlap.
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from instrumentation import stage
+
+
+class ComputeGraph:
+    def __init__(self, max_workers=None):
+        # name: (function, dependency names)
+        self.nodes = {}
+        self.values = {}
+        self.max_workers = max_workers
+
+    def add(self, name, func, *deps):
+        if name in self.nodes:
+            raise ValueError(f'node {name!r} is already defined')
+        self.nodes[name] = (func, deps)
+        return func
+
+    def node(self, name, *deps):
+        # decorator form of add(): the function takes the dependencies' values in order
+        return lambda func: self.add(name, func, *deps)
+
+    def required(self, targets):
+        # the targets and every node they depend on
+        seen, stack = set(), list(targets)
+        while stack:
+            name = stack.pop()
+            if name in seen:
+                continue
+            if name not in self.nodes:
+                raise KeyError(f'no node named {name!r}')
+            seen.add(name)
+            stack.extend(self.nodes[name][1])
+        return seen
+
+    def _run(self, name):
+        func, deps = self.nodes[name]
+        with stage(f'node:{name}'):
+            return func(*(self.values[dep] for dep in deps))
+
+    def evaluate(self, targets, max_workers=None):
+        # {target: value}; a failing node's exception is raised once the nodes already running finish
+        targets = list(targets)
+        todo = {name for name in self.required(targets) if name not in self.values}
+        if todo:
+            workers = max_workers or self.max_workers or min(len(todo), (os.cpu_count() or 1) + 4)
+            running = {}
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                while todo or running:
+                    ready = [name for name in todo if all(dep in self.values for dep in self.nodes[name][1])]
+                    for name in ready:
+                        todo.discard(name)
+                        running[pool.submit(self._run, name)] = name
+                    if not running:
+                        raise ValueError(f"dependency cycle among {', '.join(sorted(todo))}")
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.values[running.pop(future)] = future.result()
+        return {name: self.values[name] for name in targets}
@@ -0,0 +1,256 @@
+# Shared data loader with a binary columnar cache for the temperature CSV
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from instrumentation import stage, timed
+
+CACHE_DIR_NAME = '.anomaly_cache'
+CACHE_VERSION = 1
+CHUNK_ROWS = 1 << 20
+# one cache build at a time per process; threads that waited find the cache built and read it
+_build_lock = threading.Lock()
+
+
+def file_digest(file_path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_dir_for(file_path, cache_dir=None):
+    file_path = os.path.abspath(file_path)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(file_path), CACHE_DIR_NAME)
+    return os.path.join(cache_dir, os.path.splitext(os.path.basename(file_path))[0])
+
+
+def parse_csv(file_path):
+    import pandas as pd
+
+    with stage('parse_csv') as record:
+        timestamps, values = _frame_arrays(pd.read_csv(file_path))
+        record.rows = len(values)
+    return timestamps, values
+
+
+def _frame_arrays(frame):
+    import pandas as pd
+
+    # int64 epoch milliseconds, naive timestamps are taken as UTC like Timestamp.timestamp()
+    timestamps = pd.to_datetime(frame['timestamp']).values.astype('datetime64[ms]').astype(np.int64)
+    return timestamps, frame['value'].to_numpy(dtype=np.float64)
+
+
+class ColumnWriter:
+    # appends chunks to a .npy file without holding the column in memory; numpy leaves room in
+    # the header for the length to grow, so it is rewritten in place on close. Rows may be
+    # fixed-width arrays themselves (row_shape), e.g. one heatmap day of slots.
+    def __init__(self, path, dtype, row_shape=()):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.rows = 0
+        self._tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        self._file = open(self._tmp_path, 'wb')
+        self._header_size = self._write_header()
+
+    def _write_header(self):
+        self._file.seek(0)
+        np.lib.format.write_array_header_1_0(self._file, {
+            'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False, 'shape': (self.rows,) + self.row_shape,
+        })
+        return self._file.tell()
+
+    def append(self, chunk):
+        chunk = np.ascontiguousarray(chunk, dtype=self.dtype).reshape((-1,) + self.row_shape)
+        self._file.write(chunk.data)
+        self.rows += len(chunk)
+
+    def close(self):
+        if self._write_header() != self._header_size:
+            raise ValueError(f'{self.path}: .npy header outgrew its reserved space')
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def column_chunks(path, chunk_rows=CHUNK_ROWS):
+    # a C-order .npy column in chunks of rows, read with plain file reads: pages already processed
+    # are not mapped into the process, so RSS stays at about one chunk however long the column is
+    with open(path, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, _, dtype = read_header(f)
+        row_shape = shape[1:]
+        row_size = int(np.prod(row_shape, dtype=np.int64))
+        for start in range(0, shape[0], chunk_rows):
+            rows = min(chunk_rows, shape[0] - start)
+            yield np.fromfile(f, dtype=dtype, count=rows * row_size).reshape((rows,) + row_shape)
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _temp_file(path, suffix):
+    # a unique name next to path, so concurrent writers never share a temp file
+    fd, tmp_path = tempfile.mkstemp(suffix=suffix, prefix=os.path.basename(path) + '.', dir=os.path.dirname(path))
+    return os.fdopen(fd, 'wb'), tmp_path
+
+
+def _write_json(path, payload):
+    f, tmp_path = _temp_file(path, '.tmp')
+    with f:
+        f.write(json.dumps(payload).encode())
+    os.replace(tmp_path, path)
+
+
+def _save_array(path, array):
+    f, tmp_path = _temp_file(path, '.tmp.npy')
+    with f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def _cache_is_fresh(file_path, meta_path):
+    return _cache_is_valid(_read_meta(meta_path), file_path, os.stat(file_path), meta_path)
+
+
+def _cache_is_valid(meta, file_path, stat, meta_path):
+    if meta is None or meta.get('version') != CACHE_VERSION:
+        return False
+    if (meta['mtime_ns'], meta['size']) == (stat.st_mtime_ns, stat.st_size):
+        return True
+    # mtime moved (touch, fresh checkout), only reparse when the contents changed
+    if meta['size'] != stat.st_size or meta['sha1'] != file_digest(file_path):
+        return False
+    meta['mtime_ns'] = stat.st_mtime_ns
+    _write_json(meta_path, meta)
+    return True
+
+
+def build_cache(file_path, cache_dir=None):
+    directory = cache_dir_for(file_path, cache_dir)
+    os.makedirs(directory, exist_ok=True)
+    stat = os.stat(file_path)
+    timestamps, values = parse_csv(file_path)
+    _save_array(os.path.join(directory, 'timestamp_ms.npy'), timestamps)
+    _save_array(os.path.join(directory, 'value.npy'), values)
+    # meta goes last so a half-written cache is never picked up as valid
+    meta = {
+        'version': CACHE_VERSION,
+        'source': os.path.abspath(file_path),
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha1': file_digest(file_path),
+        'rows': int(len(values)),
+    }
+    _write_json(os.path.join(directory, 'meta.json'), meta)
+    return timestamps, values
+
+
+def build_cache_chunked(file_path, cache_dir=None, chunk_rows=CHUNK_ROWS):
+    # the same cache as build_cache, converted chunk_rows CSV lines at a time
+    import pandas as pd
+
+    directory = cache_dir_for(file_path, cache_dir)
+    os.makedirs(directory, exist_ok=True)
+    stat = os.stat(file_path)
+    with stage('convert_csv') as record:
+        with ColumnWriter(os.path.join(directory, 'timestamp_ms.npy'), np.int64) as timestamp_column, \
+                ColumnWriter(os.path.join(directory, 'value.npy'), np.float64) as value_column:
+            for frame in pd.read_csv(file_path, chunksize=chunk_rows):
+                timestamps, values = _frame_arrays(frame)
+                timestamp_column.append(timestamps)
+                value_column.append(values)
+        record.rows = value_column.rows
+    meta = {
+        'version': CACHE_VERSION,
+        'source': os.path.abspath(file_path),
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha1': file_digest(file_path),
+        'rows': value_column.rows,
+    }
+    _write_json(os.path.join(directory, 'meta.json'), meta)
+    return directory
+
+
+def cached_columns(file_path, cache_dir=None, chunk_rows=CHUNK_ROWS):
+    # {'timestamp_ms': path, 'value': path} of the binary cache, converted chunk by chunk if stale
+    directory = cache_dir_for(file_path, cache_dir)
+    meta_path = os.path.join(directory, 'meta.json')
+    if not _cache_is_fresh(file_path, meta_path):
+        with _build_lock:
+            if not _cache_is_fresh(file_path, meta_path):
+                build_cache_chunked(file_path, cache_dir, chunk_rows)
+    return {name: os.path.join(directory, name + '.npy') for name in ('timestamp_ms', 'value')}
+
+
+def cache_meta(file_path, cache_dir=None):
+    # meta.json of the binary cache (sha1, size, mtime_ns, rows), building the cache if it is stale
+    meta_path = os.path.join(cache_dir_for(file_path, cache_dir), 'meta.json')
+    if not _cache_is_fresh(file_path, meta_path):
+        with _build_lock:
+            if not _cache_is_fresh(file_path, meta_path):
+                build_cache(file_path, cache_dir)
+    return _read_meta(meta_path)
+
+
+@timed('load_arrays')
+def load_arrays(file_path, value_dtype=np.float64, cache_dir=None, mmap_mode=None):
+    directory = cache_dir_for(file_path, cache_dir)
+    meta_path = os.path.join(directory, 'meta.json')
+    if not _cache_is_fresh(file_path, meta_path):
+        with _build_lock:
+            if not _cache_is_fresh(file_path, meta_path):
+                timestamps, values = build_cache(file_path, cache_dir)
+                return timestamps, values.astype(value_dtype, copy=False)
+    timestamps = np.load(os.path.join(directory, 'timestamp_ms.npy'), mmap_mode=mmap_mode)
+    values = np.load(os.path.join(directory, 'value.npy'), mmap_mode=mmap_mode)
+    return timestamps, values.astype(value_dtype, copy=False)
+
+
+@timed('load_data')
+def load_data(file_path, value_dtype=np.float64, cache_dir=None):
+    import pandas as pd
+
+    timestamps, values = load_arrays(file_path, value_dtype=value_dtype, cache_dir=cache_dir)
+    data = pd.DataFrame({
+        'timestamp': timestamps.astype('datetime64[ms]'),
+        'value': values,
+    })
+    data['timestamp_unix'] = timestamps.astype(np.float64)
+    return data
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:] or ['machine_temperature_system_failure.csv']:
+        start = time.perf_counter()
+        timestamps, values = load_arrays(path)
+        print(f'{path}: {len(values)} rows in {(time.perf_counter() - start) * 1000:.1f} ms')
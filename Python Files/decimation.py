@@ -0,0 +1,85 @@
+# Downsampling of line series before they are pushed to a chart
+# Both methods return sorted indices into the original arrays, so any column can be taken at the
+# same points. max_points is a hard cap: indices passed as `keep` (detected anomalies) are taken
+# first, up to half of it, and the line gets the rest of the budget. More than that many kept
+# indices are themselves thinned to their min/max per bucket, so the highest and lowest detections still show.
+import numpy as np
+
+from instrumentation import timed
+
+METHODS = ('minmax', 'lttb')
+
+
+def _bucket_edges(x, n_buckets):
+    # bucket b covers x in [x0 + b * width, x0 + (b + 1) * width), one bucket per pixel column
+    edges = np.linspace(x[0], x[-1], n_buckets + 1)
+    return np.searchsorted(x, edges[1:-1], side='left')
+
+
+def minmax_indices(x, y, n_buckets):
+    # first, last, min and max reading of every bucket, at most 4 points per bucket
+    n = len(x)
+    bounds = np.unique(np.concatenate(([0], _bucket_edges(x, n_buckets))))
+    bounds = bounds[bounds < n]
+    counts = np.diff(np.append(bounds, n))
+    segment = np.repeat(np.arange(len(bounds)), counts)
+    picked = [bounds, np.append(bounds[1:] - 1, n - 1)]
+    for reduce in (np.minimum, np.maximum):
+        extreme = reduce.reduceat(y, bounds)
+        hits = np.flatnonzero(y == extreme[segment])
+        # the first hit in each bucket
+        _, first = np.unique(segment[hits], return_index=True)
+        picked.append(hits[first])
+    return np.unique(np.concatenate(picked))
+
+
+def _ends(n, n_out):
+    # the first and last reading, or only the first, for budgets too small for either method
+    return np.array([0, n - 1][:max(0, min(n_out, n))], dtype=np.int64)
+
+
+def lttb_indices(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: keeps the first and last reading and, from each bucket in
+    # between, the one spanning the largest triangle with the previous pick and the next bucket's mean
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return _ends(n, n_out)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    picked = np.empty(n_out, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    # next-bucket means for every bucket at once; the last bucket looks at the final reading
+    x_sums = np.add.reduceat(x[:n - 1], edges[:-1])
+    y_sums = np.add.reduceat(y[:n - 1], edges[:-1])
+    sizes = np.diff(edges)
+    x_next = np.append(x_sums[1:] / sizes[1:], x[-1])
+    y_next = np.append(y_sums[1:] / sizes[1:], y[-1])
+    a = 0
+    for b in range(n_out - 2):
+        start, stop = edges[b], edges[b + 1]
+        xs, ys = x[start:stop], y[start:stop]
+        area = np.abs((x[a] - x_next[b]) * (ys - y[a]) - (x[a] - xs) * (y_next[b] - y[a]))
+        a = start + int(np.argmax(area))
+        picked[b + 1] = a
+    return picked
+
+
+@timed('decimate', rows='x')
+def decimate(x, y, max_points, method='minmax', keep=None):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if max_points is None or len(x) <= max_points:
+        return np.arange(len(x))
+    if method not in METHODS:
+        raise ValueError(f'unknown decimation method {method!r}, expected one of {METHODS}')
+    keep = np.unique(np.asarray(keep if keep is not None else [], dtype=np.int64))
+    if len(keep) > max_points // 2:
+        # under 8 points even a single bucket's four can be more than half
+        keep = keep[minmax_indices(x[keep], y[keep], max(1, max_points // 8))][:max_points // 2]
+    budget = max_points - len(keep)
+    if method == 'minmax':
+        indices = minmax_indices(x, y, budget // 4) if budget >= 4 else _ends(len(x), budget)
+    else:
+        indices = lttb_indices(x, y, budget)
+    return np.union1d(indices, keep)
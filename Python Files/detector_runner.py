@@ -0,0 +1,120 @@
+# Parallel detector runner
+# Independent detectors run on a process pool. The value column goes to the workers through
+# shared memory, and workers write scores and labels straight into a shared output block,
+# so only the job description and the fitted model cross process boundaries.
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from detectors import DEFAULT_PARAMS, DetectorResult, run_detector
+from instrumentation import absorb, drain, stage
+
+# rough relative cost, used to start the slowest fits first
+COST_RANK = ['ocsvm', 'lof', 'iforest', 'changefinder', 'hotelling', 'variance']
+
+
+def _fork_context():
+    # fork keeps the dashboards working as plain top-level scripts: spawn would re-run the
+    # calling script in every worker. Where fork is missing, fall back to threads, which
+    # still overlap the fits that release the GIL.
+    try:
+        return multiprocessing.get_context('fork')
+    except ValueError:
+        return None
+
+
+def _run_job(row, name, params, values_name, output_name, n, dtype):
+    values_segment = shared_memory.SharedMemory(name=values_name)
+    output_segment = shared_memory.SharedMemory(name=output_name)
+    try:
+        values = np.ndarray((n,), dtype=dtype, buffer=values_segment.buf)
+        result = run_detector(name, values, **params)
+        output = np.ndarray((2, n), dtype=np.float64, buffer=output_segment.buf, offset=row * 2 * n * 8)
+        output[0] = result.scores
+        output[1] = result.labels
+        # stage records made in the worker travel back with the result
+        return row, result.model, drain()
+    finally:
+        # drop the views before closing, the segments refuse to close while exported
+        values = output = None
+        values_segment.close()
+        output_segment.close()
+
+
+def _run_in_threads(values, pending, labels, workers):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {label: pool.submit(run_detector, pending[label][0], values, **pending[label][1]) for label in labels}
+        return {label: future.result() for label, future in futures.items()}
+
+
+def _run_in_processes(values, pending, labels, workers, context):
+    n = len(values)
+    values_segment = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    # one row of scores followed by one row of labels per job
+    output_segment = shared_memory.SharedMemory(create=True, size=max(2 * len(labels) * n * 8, 1))
+    try:
+        np.ndarray(values.shape, dtype=values.dtype, buffer=values_segment.buf)[:] = values
+        models = {}
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [
+                pool.submit(_run_job, row, pending[label][0], pending[label][1],
+                            values_segment.name, output_segment.name, n, values.dtype.str)
+                for row, label in enumerate(labels)
+            ]
+            for future in as_completed(futures):
+                row, model, records = future.result()
+                models[labels[row]] = model
+                absorb(records)
+        output = np.ndarray((len(labels), 2, n), dtype=np.float64, buffer=output_segment.buf).copy()
+    finally:
+        values_segment.close()
+        values_segment.unlink()
+        output_segment.close()
+        output_segment.unlink()
+    return {
+        label: DetectorResult(output[row, 0], output[row, 1].astype(bool), models[label])
+        for row, label in enumerate(labels)
+    }
+
+
+def _normalize_jobs(jobs):
+    if jobs is None:
+        jobs = list(DEFAULT_PARAMS)
+    if isinstance(jobs, dict):
+        return {label: (job, {}) if isinstance(job, str) else job for label, job in jobs.items()}
+    return {name: (name, {}) for name in jobs}
+
+
+def run_detectors(values, jobs=None, cache=None, max_workers=None):
+    # jobs: detector names, or {label: (name, params)}; returns {label: DetectorResult}
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    jobs = _normalize_jobs(jobs)
+    results = {}
+    pending = {}
+    for label, (name, params) in jobs.items():
+        params = {**DEFAULT_PARAMS[name], **params}
+        key = cache.key(name, values, params) if cache is not None else None
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            results[label] = cached
+        else:
+            pending[label] = (name, params, key)
+    if not pending:
+        return results
+
+    labels = sorted(pending, key=lambda label: COST_RANK.index(pending[label][0]))
+    workers = max_workers or min(len(labels), os.cpu_count() or 1)
+    context = _fork_context()
+    with stage('run_detectors', rows=len(values), jobs=len(labels), workers=workers):
+        if context is None or workers == 1:
+            computed = _run_in_threads(values, pending, labels, workers)
+        else:
+            computed = _run_in_processes(values, pending, labels, workers, context)
+    for label, result in computed.items():
+        if cache is not None:
+            cache.put(pending[label][2], result)
+        results[label] = result
+    return {label: results[label] for label in jobs}
@@ -0,0 +1,107 @@
+# Anomaly detectors shared by the dashboards
+# Each detector takes the 1-D value column and returns scores, 0/1-style labels and the fitted model.
+from collections import namedtuple
+
+import numpy as np
+
+from instrumentation import stage
+
+DetectorResult = namedtuple('DetectorResult', ['scores', 'labels', 'model'])
+
+DEFAULT_PARAMS = {
+    'hotelling': {'q': 0.95},
+    'ocsvm': {'nu': 0.2, 'gamma': 0.001, 'kernel': 'rbf', 'mode': 'exact'},
+    'iforest': {'n_estimators': 300, 'contamination': 0.1, 'max_samples': 700, 'random_state': 42},
+    'lof': {'n_neighbors': 500, 'contamination': 0.07, 'mode': 'exact'},
+    'changefinder': {'r': 0.002, 'order': 1, 'smooth': 250, 'iqr_factor': 3},
+    'variance': {'n_sigma': 1.5},
+}
+
+
+def _column(values):
+    return np.asarray(values, dtype=np.float64).reshape(-1, 1)
+
+
+def hotelling(values, q):
+    from scipy.stats import chi2
+
+    scores = ((values - values.mean()) / values.std(ddof=1)) ** 2
+    return DetectorResult(scores, scores > chi2.ppf(q=q, df=1), None)
+
+
+def ocsvm(values, nu, gamma, kernel, mode, **options):
+    # mode 'nystroem' or 'sample' trades exactness for near-linear fit time, see ocsvm_approx
+    from ocsvm_approx import fit_ocsvm
+
+    model = fit_ocsvm(values, nu, gamma, kernel, mode=mode, **options)
+    scores = model.decision_function(_column(values))
+    return DetectorResult(scores, scores < 0, model)
+
+
+def iforest(values, n_estimators, contamination, max_samples, random_state):
+    from sklearn.ensemble import IsolationForest
+
+    model = IsolationForest(
+        n_estimators=n_estimators, contamination=contamination,
+        max_samples=max_samples, random_state=random_state,
+    ).fit(_column(values))
+    scores = model.decision_function(_column(values))
+    return DetectorResult(scores, scores < 0, model)
+
+
+def lof(values, n_neighbors, contamination, mode):
+    # mode 'sorted' is lof_1d's sort-based LOF: much faster, but ties at the k-th distance
+    # can be broken differently from sklearn's, so a few labels may differ
+    if mode == 'exact':
+        from sklearn.neighbors import LocalOutlierFactor
+
+        model = LocalOutlierFactor(n_neighbors=n_neighbors, contamination=contamination).fit(_column(values))
+    elif mode == 'sorted':
+        from lof_1d import LocalOutlierFactor1D
+
+        model = LocalOutlierFactor1D(n_neighbors=n_neighbors, contamination=contamination).fit(_column(values))
+    else:
+        raise ValueError(f"unknown LOF mode {mode!r}, expected 'exact' or 'sorted'")
+    scores = model.negative_outlier_factor_
+    # outlier-detection LOF cannot score new data, so only the scores are kept
+    return DetectorResult(scores, scores < model.offset_, None)
+
+
+def changefinder_threshold(scores, iqr_factor):
+    # scores may also be a sketches.KLLSketch built chunk by chunk or merged across shards
+    if hasattr(scores, 'quantiles'):
+        q1, q3 = scores.quantiles([0.25, 0.75])
+    else:
+        q1, q3 = np.percentile(scores, [25, 75])
+    return q3 + (q3 - q1) * iqr_factor
+
+
+def changefinder(values, r, order, smooth, iqr_factor):
+    from cf_kernel import changefinder_scores
+
+    scores = changefinder_scores(values, r=r, order=order, smooth=smooth)
+    return DetectorResult(scores, scores > changefinder_threshold(scores, iqr_factor), None)
+
+
+def variance(values, n_sigma):
+    scores = (values - values.mean()) / values.std(ddof=1)
+    return DetectorResult(scores, np.abs(scores) > n_sigma, None)
+
+
+DETECTORS = {
+    'hotelling': hotelling,
+    'ocsvm': ocsvm,
+    'iforest': iforest,
+    'lof': lof,
+    'changefinder': changefinder,
+    'variance': variance,
+}
+
+
+def run_detector(name, values, cache=None, **params):
+    params = {**DEFAULT_PARAMS[name], **params}
+    values = np.asarray(values, dtype=np.float64)
+    with stage(f'detector:{name}', rows=len(values)):
+        if cache is None:
+            return DETECTORS[name](values, **params)
+        return cache.get_or_compute(name, values, params, lambda: DETECTORS[name](values, **params))
@@ -0,0 +1,176 @@
+# Day x time-of-day heatmap grid built straight from epoch timestamps
+# Readings are scattered into (slot, day) cells of float64 sums and counts; the float32
+# intensity grid is laid out the way add_heatmap_grid_series expects it (columns are slots,
+# rows are days) and empty cells are tracked in the gaps mask. New readings only touch their
+# own cells, and update() reports the block to re-send with invalidate_intensity_values.
+import os
+
+import numpy as np
+
+from data_loader import ColumnWriter, column_chunks
+from instrumentation import timed
+
+DAY_MS = 24 * 60 * 60 * 1000
+SLOT_MS = 5 * 60 * 1000
+
+
+class HeatmapGrid:
+    def __init__(self, origin_ms, n_days, slot_ms=SLOT_MS):
+        # origin_ms is midnight (UTC) of the first day
+        if DAY_MS % slot_ms:
+            raise ValueError('slot_ms must divide a day evenly')
+        self.origin_ms = int(origin_ms)
+        self.slot_ms = slot_ms
+        self.n_slots = DAY_MS // slot_ms
+        self.n_days = n_days
+        self.sums = np.zeros((self.n_slots, n_days))
+        self.counts = np.zeros((self.n_slots, n_days), dtype=np.int32)
+        self.grid = np.zeros((self.n_slots, n_days), dtype=np.float32)
+        self.fill_value = np.nan
+
+    @classmethod
+    @timed('heatmap_grid', rows='values')
+    def from_arrays(cls, timestamps, values, slot_ms=SLOT_MS):
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        first_day, last_day = timestamps.min() // DAY_MS, timestamps.max() // DAY_MS
+        grid = cls(first_day * DAY_MS, int(last_day - first_day + 1), slot_ms)
+        grid.update(timestamps, values)
+        return grid
+
+    @property
+    def gaps(self):
+        return self.counts == 0
+
+    def cells(self, timestamps):
+        offsets = np.asarray(timestamps, dtype=np.int64) - self.origin_ms
+        return offsets % DAY_MS // self.slot_ms, offsets // DAY_MS
+
+    def gap_fill(self):
+        # pandas pivot_table(...).fillna(pivot.mean().mean()): the mean over slots of each slot's
+        # mean over days, taken over the slots that have any reading
+        filled = self.counts.sum(axis=1) > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cell_means = self.sums[filled] / self.counts[filled]
+        present = self.counts[filled] > 0
+        slot_means = np.where(present, cell_means, 0.0).sum(axis=1) / present.sum(axis=1)
+        return float(slot_means.mean()) if len(slot_means) else np.nan
+
+    def update(self, timestamps, values):
+        # adds readings and returns the (slot_start, slot_stop, day_start, day_stop) block that changed,
+        # None when there was nothing to add. Gaps keep the current fill value until refill().
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return None
+        slots, days = self.cells(timestamps)
+        if days.min() < 0:
+            raise ValueError('readings before the first day of the grid')
+        grown = days.max() >= self.n_days
+        if grown:
+            self.grow(int(days.max()) + 1)
+        # unique cells first, so a small batch only touches its own cells
+        cells, inverse = np.unique(slots * self.n_days + days, return_inverse=True)
+        self.sums.reshape(-1)[cells] += np.bincount(inverse, weights=values)
+        self.counts.reshape(-1)[cells] += np.bincount(inverse).astype(np.int32)
+        if np.isnan(self.fill_value) or grown:
+            return self.refill()
+        block = (int(slots.min()), int(slots.max()) + 1, int(days.min()), int(days.max()) + 1)
+        self._refresh(*block)
+        return block
+
+    def refill(self):
+        self.fill_value = self.gap_fill()
+        self._refresh(0, self.n_slots, 0, self.n_days)
+        return 0, self.n_slots, 0, self.n_days
+
+    def _refresh(self, slot_start, slot_stop, day_start, day_stop):
+        sums = self.sums[slot_start:slot_stop, day_start:day_stop]
+        counts = self.counts[slot_start:slot_stop, day_start:day_stop]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(counts > 0, sums / counts, self.fill_value)
+        self.grid[slot_start:slot_stop, day_start:day_stop] = means
+
+    def grow(self, n_days):
+        # a heatmap series has a fixed size, so after growing it has to be recreated with n_days rows
+        for name in ('sums', 'counts', 'grid'):
+            old = getattr(self, name)
+            new = np.zeros((self.n_slots, n_days), dtype=old.dtype)
+            new[:, :self.n_days] = old
+            setattr(self, name, new)
+        self.n_days = n_days
+
+    def block(self, slot_start, slot_stop, day_start, day_stop):
+        return self.grid[slot_start:slot_stop, day_start:day_stop]
+
+
+def push(series, grid, block):
+    # re-send just the changed cells to a heatmap grid series
+    if block is not None:
+        slot_start, slot_stop, day_start, day_stop = block
+        series.invalidate_intensity_values(grid.block(*block), column_index=slot_start, row_index=day_start)
+
+
+class HeatmapWriter:
+    # HeatmapGrid for histories that do not fit in memory. Readings must arrive in time order;
+    # only the days of the current batch are held, every finished day is written out as a row of
+    # cell means, and close() fills the gaps into a (days, slots) float32 .npy, i.e. grid.T.
+    def __init__(self, path, origin_ms, slot_ms=SLOT_MS):
+        if DAY_MS % slot_ms:
+            raise ValueError('slot_ms must divide a day evenly')
+        self.path = path
+        self.origin_ms = int(origin_ms)
+        self.slot_ms = slot_ms
+        self.n_slots = DAY_MS // slot_ms
+        self.n_days = 0
+        self.fill_value = np.nan
+        # open days, from day n_days on
+        self._sums = np.zeros((0, self.n_slots))
+        self._counts = np.zeros((0, self.n_slots), dtype=np.int32)
+        # per slot: sum of the cell means over the days with readings, and how many such days
+        self._slot_means = np.zeros(self.n_slots)
+        self._slot_days = np.zeros(self.n_slots, dtype=np.int64)
+        self._cells = ColumnWriter(path + '.cells.npy', np.float32, (self.n_slots,))
+
+    def update(self, timestamps, values):
+        offsets = np.asarray(timestamps, dtype=np.int64) - self.origin_ms
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+        days = offsets // DAY_MS - self.n_days
+        if days.min() < 0:
+            raise ValueError('readings for a day that is already written, HeatmapWriter needs them in time order')
+        open_days = int(days.max()) + 1
+        if open_days > len(self._sums):
+            self._sums = np.concatenate((self._sums, np.zeros((open_days - len(self._sums), self.n_slots))))
+            self._counts = np.concatenate((self._counts, np.zeros((open_days - len(self._counts), self.n_slots), dtype=np.int32)))
+        cells = days * self.n_slots + offsets % DAY_MS // self.slot_ms
+        self._sums.reshape(-1)[:] += np.bincount(cells, weights=values, minlength=self._sums.size)
+        self._counts.reshape(-1)[:] += np.bincount(cells, minlength=self._counts.size).astype(np.int32)
+        # the last day may still get readings from the next batch
+        self._flush(open_days - 1)
+
+    def _flush(self, n):
+        sums, counts = self._sums[:n], self._counts[:n]
+        present = counts > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(present, sums / counts, np.nan)
+        self._slot_means += np.where(present, means, 0.0).sum(axis=0)
+        self._slot_days += present.sum(axis=0)
+        self._cells.append(means)
+        self._sums, self._counts = self._sums[n:], self._counts[n:]
+        self.n_days += n
+
+    def close(self, chunk_days=4096):
+        self._flush(len(self._sums))
+        self._cells.close()
+        # the same fill as HeatmapGrid.gap_fill: mean over slots of each slot's mean over days
+        filled = self._slot_days > 0
+        self.fill_value = float((self._slot_means[filled] / self._slot_days[filled]).mean()) if filled.any() else np.nan
+        with ColumnWriter(self.path, np.float32, (self.n_slots,)) as grid:
+            for block in column_chunks(self._cells.path, chunk_days):
+                grid.append(np.where(np.isnan(block), np.float32(self.fill_value), block))
+        os.remove(self._cells.path)
+        return self.path
+
+    def abort(self):
+        self._cells.abort()
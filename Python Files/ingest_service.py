@@ -0,0 +1,420 @@
+# Local ingest service for live machine readings
+# Producers connect over TCP or a UNIX socket and send 'timestamp,value,sensor_id' lines. Each
+# sensor has a bounded queue and its own online detectors (streaming.StreamingEngine); its worker
+# scores readings in micro-batches of up to batch_size, waiting at most max_delay after the first
+# reading. When a sensor falls behind its queue fills, producer connections stop being read until
+# there is room again, and TCP / UNIX socket flow control pushes back on the producers.
+# Alerts go out as JSON lines to every subscriber of the alerts endpoint; a subscriber that cannot
+# keep up loses alerts (they are counted) rather than holding up detection.
+# Latency is per reading, from the moment its line is read off the socket to the moment its batch
+# is scored. `bench` replays the CSV through an in-process service and reports throughput and p99.
+import argparse
+import asyncio
+import json
+import math
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from sketches import KLLSketch
+from streaming import StreamingEngine
+
+DEFAULT_HOST = '127.0.0.1'
+# live_replay.py listens on 9009
+DEFAULT_PORT = 9010
+DEFAULT_ALERTS_PORT = 9011
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_MAX_DELAY = 0.005
+# readings waiting per sensor before its producers are paused; this depth, not the batching, sets p99
+DEFAULT_QUEUE_SIZE = 1024
+# alerts waiting per subscriber; a replay raises alerts in bursts of thousands
+DEFAULT_ALERT_QUEUE_SIZE = 65536
+# seconds close() gives a subscriber to take the alerts still queued for it
+DEFAULT_CLOSE_TIMEOUT = 5.0
+# rank error about 0.14% of n (sketches.rank_error), so p99 is read between p98.86 and p99.14
+LATENCY_K = 2000
+READ_SIZE = 1 << 16
+
+
+@lru_cache(maxsize=4096)
+def epoch_ms(stamp):
+    # sensors sharing a clock send the same stamps, so most lines hit the cache
+    return int(stamp) if stamp.isdigit() else int(np.datetime64(stamp.decode(), 'ms').astype(np.int64))
+
+
+def parse_line(line):
+    # b'timestamp,value,sensor_id' -> (epoch ms, value, sensor id), None for headers and bad lines.
+    # Timestamps are epoch milliseconds or anything np.datetime64 reads, like the CSV's. NaN and
+    # infinite values are bad lines too: one would poison the sensor's running detector state for good.
+    fields = line.split(b',')
+    if len(fields) != 3:
+        return None
+    try:
+        value = float(fields[1])
+        if not math.isfinite(value):
+            return None
+        return epoch_ms(fields[0].strip()), value, fields[2].strip().decode()
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def alert_message(sensor_id, alert, latency):
+    return (json.dumps({
+        'sensor': sensor_id,
+        'detector': alert.detector,
+        'timestamp': str(np.datetime64(int(alert.timestamp), 'ms')),
+        'value': alert.value,
+        'score': alert.score,
+        'threshold': alert.threshold,
+        'latency_ms': round(latency * 1000, 3),
+    }) + '\n').encode()
+
+
+class IngestService:
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, max_delay=DEFAULT_MAX_DELAY, queue_size=DEFAULT_QUEUE_SIZE,
+                 alert_queue_size=DEFAULT_ALERT_QUEUE_SIZE, close_timeout=DEFAULT_CLOSE_TIMEOUT,
+                 engine_factory=StreamingEngine):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.queue_size = queue_size
+        self.alert_queue_size = alert_queue_size
+        self.close_timeout = close_timeout
+        self.engine_factory = engine_factory
+        # sensor id: (queue, worker task)
+        self.sensors = {}
+        self.subscribers = set()
+        # connection handler tasks, so drain() and close() can wait for them
+        self.producers = set()
+        self.subscriptions = set()
+        self.latency = KLLSketch(LATENCY_K)
+        self.readings = 0
+        self.rejected = 0
+        self.batches = 0
+        self.alerts = 0
+        self.dropped_alerts = 0
+        self.paused = 0
+        self.first_arrival = None
+        self.last_scored = None
+
+    def _queue(self, sensor_id):
+        if sensor_id not in self.sensors:
+            queue = asyncio.Queue(maxsize=self.queue_size)
+            self.sensors[sensor_id] = (queue, asyncio.create_task(self._score(sensor_id, queue)))
+        return self.sensors[sensor_id][0]
+
+    async def handle_producer(self, reader, writer):
+        self.producers.add(asyncio.current_task())
+        partial = b''
+        try:
+            while True:
+                chunk = await reader.read(READ_SIZE)
+                if not chunk:
+                    break
+                now = time.perf_counter()
+                if self.first_arrival is None:
+                    self.first_arrival = now
+                *lines, partial = (partial + chunk).split(b'\n')
+                for line in lines:
+                    await self._put(line, now)
+                # let the workers score what this chunk queued before reading the next one
+                await asyncio.sleep(0)
+            if partial.strip():
+                await self._put(partial, time.perf_counter())
+        finally:
+            self.producers.discard(asyncio.current_task())
+            writer.close()
+
+    async def _put(self, line, now):
+        reading = parse_line(line)
+        if reading is None:
+            self.rejected += 1
+            return
+        queue = self._queue(reading[2])
+        try:
+            queue.put_nowait((reading[0], reading[1], now))
+        except asyncio.QueueFull:
+            # backpressure: this connection is not read again until the sensor catches up
+            self.paused += 1
+            await queue.put((reading[0], reading[1], now))
+
+    async def _score(self, sensor_id, queue):
+        engine = self.engine_factory()
+        while True:
+            batch = [await queue.get()]
+            deadline = batch[0][2] + self.max_delay
+            while len(batch) < self.batch_size:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self._process(sensor_id, engine, batch)
+            for _ in batch:
+                queue.task_done()
+
+    def _process(self, sensor_id, engine, batch):
+        timestamps, values, arrived = (np.array(column) for column in zip(*batch))
+        alerts = engine.update_batch(timestamps, values)
+        done = time.perf_counter()
+        self.latency.update(done - arrived)
+        self.readings += len(batch)
+        self.batches += 1
+        self.last_scored = done
+        for alert in alerts:
+            reading = np.flatnonzero(timestamps == alert.timestamp)[0]
+            self.publish(alert_message(sensor_id, alert, done - arrived[reading]))
+
+    def publish(self, message):
+        self.alerts += 1
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.dropped_alerts += 1
+
+    async def handle_subscriber(self, reader, writer):
+        queue = asyncio.Queue(maxsize=self.alert_queue_size)
+        self.subscribers.add(queue)
+        self.subscriptions.add(asyncio.current_task())
+        try:
+            # None is close()'s signal to hang up
+            while (message := await queue.get()) is not None:
+                # everything already queued goes out in one write
+                messages = [message]
+                while not queue.empty() and messages[-1] is not None:
+                    messages.append(queue.get_nowait())
+                writer.write(b''.join(message for message in messages if message is not None))
+                await writer.drain()
+                if messages[-1] is None:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.subscribers.discard(queue)
+            self.subscriptions.discard(asyncio.current_task())
+            writer.close()
+
+    async def drain(self):
+        # returns once the open producer connections have closed and all they sent is scored
+        await asyncio.gather(*self.producers, return_exceptions=True)
+        for queue, _ in list(self.sensors.values()):
+            await queue.join()
+
+    async def close(self):
+        for task in self.producers:
+            task.cancel()
+        for _, task in self.sensors.values():
+            task.cancel()
+        await asyncio.gather(*self.producers, *(task for _, task in self.sensors.values()), return_exceptions=True)
+        await asyncio.gather(*(self._hang_up(queue) for queue in list(self.subscribers)))
+        subscriptions = list(self.subscriptions)
+        if subscriptions:
+            # a subscriber still stuck writing after close_timeout is cut off
+            _, stuck = await asyncio.wait(subscriptions, timeout=self.close_timeout)
+            for task in stuck:
+                task.cancel()
+            await asyncio.gather(*subscriptions, return_exceptions=True)
+
+    async def _hang_up(self, queue):
+        # None goes in behind the alerts already queued, so they are still written; whatever a slow
+        # subscriber has not taken within close_timeout is discarded and counted as dropped
+        try:
+            await asyncio.wait_for(queue.put(None), self.close_timeout)
+        except asyncio.TimeoutError:
+            while not queue.empty():
+                queue.get_nowait()
+                self.dropped_alerts += 1
+            queue.put_nowait(None)
+
+    @property
+    def throughput(self):
+        if self.first_arrival is None or self.last_scored is None or self.last_scored <= self.first_arrival:
+            return 0.0
+        return self.readings / (self.last_scored - self.first_arrival)
+
+    def summary(self):
+        latency = 'no latency yet'
+        if self.latency.count:
+            p50, p99 = self.latency.quantiles([0.5, 0.99]) * 1000
+            latency = f'latency p50 {p50:.2f} ms p99 {p99:.2f} ms max {self.latency.max * 1000:.2f} ms'
+        return (f'{self.readings:,} readings from {len(self.sensors)} sensors at {self.throughput:,.0f}/s, {latency}, '
+                f'{self.batches:,} batches, {self.alerts:,} alerts ({self.dropped_alerts:,} dropped), '
+                f'{self.rejected:,} bad lines, {self.paused:,} pauses')
+
+
+async def start_servers(service, host=DEFAULT_HOST, port=DEFAULT_PORT, unix=None,
+                        alerts_port=DEFAULT_ALERTS_PORT, alerts_unix=None):
+    # (producer server, alerts server); port 0 picks a free port
+    if unix:
+        producers = await asyncio.start_unix_server(service.handle_producer, unix)
+    else:
+        producers = await asyncio.start_server(service.handle_producer, host, port)
+    if alerts_unix:
+        alerts = await asyncio.start_unix_server(service.handle_subscriber, alerts_unix)
+    else:
+        alerts = await asyncio.start_server(service.handle_subscriber, host, alerts_port)
+    return producers, alerts
+
+
+async def connect(host=DEFAULT_HOST, port=DEFAULT_PORT, unix=None):
+    if unix:
+        return await asyncio.open_unix_connection(unix)
+    return await asyncio.open_connection(host, port)
+
+
+def replay_blocks(file_path, sensors=1, connections=1, lines_per_write=512):
+    # the CSV's lines once per sensor id, in time order, as a list of byte blocks per connection;
+    # sensor i is sent over connection i % connections
+    with open(file_path, 'rb') as f:
+        rows = [line.rstrip(b'\r\n') for line in f.readlines()[1:] if line.strip()]
+    blocks = []
+    for connection in range(connections):
+        ids = [f'sensor-{i}'.encode() for i in range(connection, sensors, connections)]
+        lines = [row + b',' + sensor_id + b'\n' for row in rows for sensor_id in ids]
+        blocks.append([b''.join(lines[i:i + lines_per_write]) for i in range(0, len(lines), lines_per_write)])
+    return blocks, len(rows) * sensors
+
+
+async def send_blocks(blocks, rate=0.0, lines_per_write=512, **address):
+    # rate: readings per second over this connection, 0 sends as fast as the service takes them
+    _, writer = await connect(**address)
+    start = time.perf_counter()
+    for i, block in enumerate(blocks):
+        writer.write(block)
+        await writer.drain()
+        if rate:
+            wait = start + (i + 1) * lines_per_write / rate - time.perf_counter()
+            if wait > 0:
+                await asyncio.sleep(wait)
+    writer.close()
+    await writer.wait_closed()
+
+
+async def load_generator(file_path, sensors=1, connections=1, rate=0.0, lines_per_write=512, **address):
+    blocks, total = replay_blocks(file_path, sensors, connections, lines_per_write)
+    began = time.perf_counter()
+    await asyncio.gather(*(send_blocks(connection_blocks, rate / connections, lines_per_write, **address)
+                           for connection_blocks in blocks))
+    return total, time.perf_counter() - began
+
+
+async def count_alerts(counter, **address):
+    reader, _ = await connect(**address)
+    while await reader.readline():
+        counter[0] += 1
+
+
+async def bench(file_path, sensors=4, connections=1, rate=0.0, **options):
+    # the service and the load generator in one event loop, on free local ports
+    from cf_kernel import warm_up
+
+    warm_up()
+    service = IngestService(**options)
+    producers, alerts = await start_servers(service, port=0, alerts_port=0)
+    port = producers.sockets[0].getsockname()[1]
+    received = [0]
+    subscriber = asyncio.create_task(count_alerts(received, port=alerts.sockets[0].getsockname()[1]))
+    total, seconds = await load_generator(file_path, sensors, connections, rate, port=port)
+    await service.drain()
+    print(f'sent {total:,} readings in {seconds:.2f} s ({total / seconds:,.0f}/s)')
+    print(service.summary())
+    producers.close()
+    alerts.close()
+    # the subscriber reads until the service hangs up, after the alerts still queued for it
+    await service.close()
+    await subscriber
+    print(f'{received[0]:,} of {service.alerts:,} alerts reached the subscriber, {service.dropped_alerts:,} dropped')
+    return service
+
+
+async def serve(report_every=10.0, **options):
+    from cf_kernel import warm_up
+
+    address = {key: options.pop(key) for key in ('host', 'port', 'unix', 'alerts_port', 'alerts_unix')}
+    warm_up()
+    service = IngestService(**options)
+    producers, alerts = await start_servers(service, **address)
+    endpoint = address['unix'] or f"{address['host']}:{address['port']}"
+    alerts_endpoint = address['alerts_unix'] or f"{address['host']}:{address['alerts_port']}"
+    print(f'readings on {endpoint}, alerts on {alerts_endpoint}')
+    try:
+        while True:
+            await asyncio.sleep(report_every)
+            print(service.summary())
+    finally:
+        producers.close()
+        alerts.close()
+        await service.close()
+        print(service.summary())
+
+
+async def subscribe(**address):
+    reader, _ = await connect(**address)
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        print(line.decode().rstrip())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Ingest live readings into the streaming detectors.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def service_options(command):
+        command.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        command.add_argument('--max-delay', type=float, default=DEFAULT_MAX_DELAY, help='seconds a reading may wait for its batch')
+        command.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help='readings waiting per sensor')
+        command.add_argument('--alert-queue-size', type=int, default=DEFAULT_ALERT_QUEUE_SIZE)
+
+    serve_command = commands.add_parser('serve', help='run the service')
+    serve_command.add_argument('--host', default=DEFAULT_HOST)
+    serve_command.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve_command.add_argument('--unix', help='UNIX socket path for readings instead of TCP')
+    serve_command.add_argument('--alerts-port', type=int, default=DEFAULT_ALERTS_PORT)
+    serve_command.add_argument('--alerts-unix', help='UNIX socket path for alert subscribers instead of TCP')
+    serve_command.add_argument('--report-every', type=float, default=10.0, help='seconds')
+    service_options(serve_command)
+
+    subscribe_command = commands.add_parser('subscribe', help='print alerts as they arrive')
+    subscribe_command.add_argument('--host', default=DEFAULT_HOST)
+    subscribe_command.add_argument('--port', type=int, default=DEFAULT_ALERTS_PORT)
+    subscribe_command.add_argument('--unix')
+
+    loadgen = commands.add_parser('loadgen', help='replay a CSV into a running service')
+    bench_command = commands.add_parser('bench', help='measure throughput and latency against an in-process service')
+    for command in (loadgen, bench_command):
+        command.add_argument('csv', nargs='?', default='machine_temperature_system_failure.csv')
+        command.add_argument('--sensors', type=int, default=4, help='copies of the CSV, one sensor id each')
+        command.add_argument('--connections', type=int, default=1)
+        command.add_argument('--rate', type=float, default=0.0, help='readings per second, 0 is unthrottled')
+    loadgen.add_argument('--host', default=DEFAULT_HOST)
+    loadgen.add_argument('--port', type=int, default=DEFAULT_PORT)
+    loadgen.add_argument('--unix')
+    service_options(bench_command)
+    args = parser.parse_args(argv)
+
+    options = {key: value for key, value in vars(args).items() if key != 'command'}
+    try:
+        if args.command == 'serve':
+            asyncio.run(serve(**options))
+        elif args.command == 'subscribe':
+            asyncio.run(subscribe(**options))
+        elif args.command == 'loadgen':
+            address = {key: options.pop(key) for key in ('host', 'port', 'unix')}
+            total, seconds = asyncio.run(load_generator(options.pop('csv'), **options, **address))
+            print(f'sent {total:,} readings in {seconds:.2f} s ({total / seconds:,.0f}/s)')
+        else:
+            asyncio.run(bench(options.pop('csv'), **options))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
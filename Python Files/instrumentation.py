@@ -0,0 +1,260 @@
+# Per-stage timing and memory instrumentation
+# Set ANOMALY_PROFILE=1 (or to a directory) and every stage() block and timed() function records
+# wall time, CPU time, peak RSS growth and row counts; ANOMALY_PROFILE_MEMORY=1 adds tracemalloc
+# peaks. At exit the run is written as a JSON profile and a Chrome trace (chrome://tracing or
+# https://ui.perfetto.dev) and summarised on stderr. Unset, stage() returns a shared no-op object
+# and timed() returns the function itself, so the hooks cost next to nothing.
+import atexit
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ENV_VAR = 'ANOMALY_PROFILE'
+MEMORY_ENV_VAR = 'ANOMALY_PROFILE_MEMORY'
+
+_enabled = False
+_trace_memory = False
+_output_dir = None
+_owner_pid = None
+_records = []
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def peak_rss_kb():
+    # high-water mark of the process; ru_maxrss is kilobytes on Linux and bytes on macOS
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+class Stage:
+    def __init__(self, name, rows=None, attrs=None):
+        self.name = name
+        self.rows = rows
+        self.attrs = attrs or {}
+        self.child_peak = 0
+
+    def __enter__(self):
+        stack = _stack()
+        self.parent = stack[-1].name if stack else None
+        self.depth = len(stack)
+        stack.append(self)
+        if _trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # the enclosing stage keeps the peak seen so far, then the peak restarts for this one
+            if stack[:-1]:
+                stack[-2].child_peak = max(stack[-2].child_peak, peak)
+            tracemalloc.reset_peak()
+            self.memory_start = current
+        self.rss_start = peak_rss_kb()
+        self.cpu_start = time.process_time_ns()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        cpu_end = time.process_time_ns()
+        record = {
+            'name': self.name,
+            'parent': self.parent,
+            'depth': self.depth,
+            'pid': os.getpid(),
+            'thread': threading.get_ident(),
+            'start_ns': self.start,
+            'wall_ms': (end - self.start) / 1e6,
+            'cpu_ms': (cpu_end - self.cpu_start) / 1e6,
+            'rows': self.rows,
+            'rows_per_s': self.rows / ((end - self.start) / 1e9) if self.rows and end > self.start else None,
+            'rss_peak_kb': peak_rss_kb(),
+            'alloc_peak_bytes': None,
+            'error': None if exc_type is None else exc_type.__name__,
+            'attrs': self.attrs,
+        }
+        if self.rss_start is not None:
+            record['rss_peak_growth_kb'] = record['rss_peak_kb'] - self.rss_start
+        if _trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            record['alloc_peak_bytes'] = max(peak, self.child_peak) - self.memory_start
+            record['alloc_net_bytes'] = current - self.memory_start
+        _stack().pop()
+        with _lock:
+            _records.append(record)
+        return False
+
+
+class _NullStage:
+    # stand-in while instrumentation is off; accepts and drops rows and attrs
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+    @property
+    def attrs(self):
+        return {}
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name, rows=None, **attrs):
+    # with stage('kde', rows=len(values)) as record: ...; record.rows can also be set inside the block
+    if not _enabled:
+        return _NULL_STAGE
+    return Stage(name, rows, attrs)
+
+
+def timed(name=None, rows=None):
+    # decorator; rows names the argument whose len() is the row count. Only functions decorated
+    # while instrumentation is on are wrapped, so turn it on before importing the modules.
+    def decorate(func):
+        if not _enabled:
+            return func
+        label = name or func.__qualname__
+        signature = inspect.signature(func) if rows else None
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            count = None
+            if signature is not None:
+                bound = signature.bind_partial(*args, **kwargs).arguments
+                try:
+                    count = len(bound[rows])
+                except (KeyError, TypeError):
+                    pass
+            with Stage(label, count):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def is_enabled():
+    return _enabled
+
+
+def drain():
+    # hands this process's records collected so far to the caller, e.g. from a pool worker back to
+    # the parent; a forked worker starts with a copy of the parent's records, which are dropped
+    pid = os.getpid()
+    with _lock:
+        taken = [record for record in _records if record['pid'] == pid]
+        del _records[:]
+    return taken
+
+
+def absorb(records):
+    # records drained from a worker nest under the stage open here; forked workers already
+    # inherited the open stages and need no shift
+    stack = _stack()
+    if stack and any(record['depth'] == 0 for record in records):
+        for record in records:
+            if record['parent'] is None:
+                record['parent'] = stack[-1].name
+            record['depth'] += len(stack)
+    with _lock:
+        _records.extend(records)
+
+
+def records():
+    with _lock:
+        return list(_records)
+
+
+def chrome_trace(stages):
+    # complete ('X') events in microseconds; perf_counter_ns is the system monotonic clock on Linux,
+    # so records from forked workers line up with the parent's
+    origin = min((record['start_ns'] for record in stages), default=0)
+    events = []
+    for record in stages:
+        args = {key: record[key] for key in ('rows', 'cpu_ms', 'rss_peak_growth_kb', 'alloc_peak_bytes', 'error')
+                if record.get(key) is not None}
+        args.update(record['attrs'])
+        events.append({
+            'name': record['name'], 'cat': 'stage', 'ph': 'X',
+            'ts': (record['start_ns'] - origin) / 1000, 'dur': record['wall_ms'] * 1000,
+            'pid': record['pid'], 'tid': record['thread'], 'args': args,
+        })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def summary(stages):
+    lines = [f"{'stage':<40}{'wall ms':>11}{'cpu ms':>11}{'rows':>12}{'rss +MiB':>10}{'alloc MiB':>11}"]
+    for record in sorted(stages, key=lambda record: record['start_ns']):
+        rows = '' if record['rows'] is None else f"{record['rows']:,}"
+        growth = '' if record.get('rss_peak_growth_kb') is None else f"{record['rss_peak_growth_kb'] / 1024:.1f}"
+        alloc = '' if record['alloc_peak_bytes'] is None else f"{record['alloc_peak_bytes'] / 2 ** 20:.1f}"
+        name = '  ' * record['depth'] + record['name']
+        lines.append(f"{name:<40}{record['wall_ms']:>11.1f}{record['cpu_ms']:>11.1f}{rows:>12}{growth:>10}{alloc:>11}")
+    return '\n'.join(lines)
+
+
+def export(directory=None, label=None):
+    # writes profile-<label>-<time>.json and the matching .trace.json; returns both paths
+    directory = directory or _output_dir or '.'
+    label = label or os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0].replace(' ', '_') or 'python'
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    os.makedirs(directory, exist_ok=True)
+    stages = records()
+    profile_path = os.path.join(directory, f'profile-{label}-{stamp}.json')
+    trace_path = os.path.join(directory, f'profile-{label}-{stamp}.trace.json')
+    with open(profile_path, 'w') as f:
+        json.dump({'script': sys.argv[0], 'pid': os.getpid(), 'created': stamp,
+                   'trace_memory': _trace_memory, 'stages': stages}, f, indent=2)
+    with open(trace_path, 'w') as f:
+        json.dump(chrome_trace(stages), f)
+    return profile_path, trace_path
+
+
+def _export_at_exit():
+    # only the process that turned profiling on writes; forked pool workers leave through os._exit
+    if _records and os.getpid() == _owner_pid:
+        profile_path, trace_path = export()
+        print(summary(records()), file=sys.stderr)
+        print(f'profile written to {profile_path} and {trace_path}', file=sys.stderr)
+
+
+def enable(output_dir=None, trace_memory=False):
+    global _enabled, _trace_memory, _output_dir, _owner_pid
+    if not _enabled:
+        atexit.register(_export_at_exit)
+    _enabled = True
+    _output_dir = output_dir
+    _owner_pid = os.getpid()
+    _trace_memory = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def _from_environment():
+    setting = os.environ.get(ENV_VAR, '').strip()
+    if setting and setting.lower() not in ('0', 'false', 'no', 'off'):
+        enable(None if setting.lower() in ('1', 'true', 'yes', 'on') else setting,
+               os.environ.get(MEMORY_ENV_VAR, '').strip() not in ('', '0'))
+
+
+_from_environment()
@@ -0,0 +1,293 @@
+# Live replay dashboard
+# Readings come from a paced replay of the CSV, a growing CSV file or a local TCP socket, go
+# through the online detectors in batches and are appended to the open charts. Only the new
+# points of each batch are sent, nothing already drawn is pushed again.
+import argparse
+import os
+import socket
+import time
+from collections import namedtuple
+from itertools import cycle
+
+import lightningchart as lc
+import numpy as np
+
+from data_loader import load_arrays
+from cf_kernel import warm_up
+from streaming import OnlineChangeFinder, P2Quantile, StreamingEngine
+
+lc.set_license('my-license-key')
+
+# data seconds replayed per wall-clock second, 86400 plays a day of readings every second
+DEFAULT_SPEED = 86400.0
+DEFAULT_BATCH_SIZE = 12
+DEFAULT_MAX_DELAY = 0.25
+DEFAULT_WINDOW_MS = 3 * 24 * 3600 * 1000
+DEFAULT_MAX_SAMPLES = 200_000
+
+DISPLAY_NAMES = {
+    'hotelling': "Hotelling's T²",
+    'variance': 'Variance Based Method',
+    'changefinder': 'ChangeFinder',
+}
+ALERT_COLORS = [lc.Color(255, 0, 0), lc.Color(255, 165, 0), lc.Color(255, 0, 255)]
+
+# ingested holds the time.perf_counter() at which each reading arrived
+Batch = namedtuple('Batch', ['timestamps', 'values', 'ingested'])
+
+
+def parse_lines(lines):
+    # 'timestamp,value' lines; the header and malformed lines are skipped.
+    # Returns the positions of the parsed lines as well, to keep ingest times aligned.
+    timestamps, values, kept = [], [], []
+    for i, line in enumerate(lines):
+        fields = line.strip().split(',')
+        try:
+            timestamps.append(np.datetime64(fields[0].strip(), 'ms').astype(np.int64))
+            values.append(float(fields[1]))
+        except (ValueError, IndexError):
+            continue
+        kept.append(i)
+    return np.array(timestamps, dtype=np.int64), np.array(values, dtype=np.float64), np.array(kept, dtype=np.int64)
+
+
+class LineBatcher:
+    # collects raw lines until batch_size are waiting or the oldest has waited max_delay seconds
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, max_delay=DEFAULT_MAX_DELAY):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.lines = []
+        self.times = []
+
+    def add(self, line, now):
+        self.lines.append(line)
+        self.times.append(now)
+
+    def ready(self, now):
+        return len(self.lines) >= self.batch_size or bool(self.lines) and now - self.times[0] >= self.max_delay
+
+    def take(self):
+        timestamps, values, kept = parse_lines(self.lines)
+        ingested = np.array(self.times)[kept]
+        self.lines, self.times = [], []
+        return Batch(timestamps, values, ingested)
+
+
+def csv_replay(file_path, speed=DEFAULT_SPEED, batch_size=DEFAULT_BATCH_SIZE):
+    # speed 0 replays as fast as the charts keep up
+    timestamps, values = load_arrays(file_path)
+    start = time.perf_counter()
+    for i in range(0, len(values), batch_size):
+        stamps = timestamps[i:i + batch_size]
+        if speed:
+            # each reading counts as ingested at its due time, so batching delay shows up in the latency
+            due = start + (stamps - timestamps[0]) / 1000.0 / speed
+            wait = due[-1] - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            ingested = due
+        else:
+            ingested = np.full(len(stamps), time.perf_counter())
+        yield Batch(stamps, values[i:i + batch_size], ingested)
+
+
+def file_tail(file_path, batch_size=DEFAULT_BATCH_SIZE, max_delay=DEFAULT_MAX_DELAY, poll=0.05, from_start=False):
+    batcher = LineBatcher(batch_size, max_delay)
+    partial = ''
+    with open(file_path) as f:
+        if not from_start:
+            f.seek(0, os.SEEK_END)
+        while True:
+            line = f.readline()
+            now = time.perf_counter()
+            if line:
+                partial += line
+                # a line without its newline is still being written
+                if partial.endswith('\n'):
+                    batcher.add(partial, now)
+                    partial = ''
+            elif not batcher.ready(now):
+                time.sleep(poll)
+            if batcher.ready(time.perf_counter()):
+                yield batcher.take()
+
+
+def socket_lines(host='127.0.0.1', port=9009, batch_size=DEFAULT_BATCH_SIZE, max_delay=DEFAULT_MAX_DELAY):
+    # listens for one producer at a time sending 'timestamp,value' lines; ends when it disconnects
+    batcher = LineBatcher(batch_size, max_delay)
+    with socket.create_server((host, port)) as server:
+        print(f'waiting for a producer on {host}:{port}')
+        connection, _ = server.accept()
+        with connection:
+            connection.settimeout(max_delay)
+            buffer = b''
+            while True:
+                try:
+                    chunk = connection.recv(65536)
+                    if not chunk:
+                        break
+                except socket.timeout:
+                    chunk = b''
+                now = time.perf_counter()
+                buffer += chunk
+                *lines, buffer = buffer.split(b'\n')
+                for line in lines:
+                    batcher.add(line.decode(errors='replace'), now)
+                if batcher.ready(now):
+                    yield batcher.take()
+            # the producer may end without a newline after its last reading
+            if buffer.strip():
+                batcher.add(buffer.decode(errors='replace'), time.perf_counter())
+        if batcher.lines:
+            yield batcher.take()
+
+
+class LatencyStats:
+    # ingest-to-chart latency with P² quantiles, so endless sources keep constant memory
+    def __init__(self, quantiles=(0.5, 0.95, 0.99)):
+        self.estimators = {q: P2Quantile(q) for q in quantiles}
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, latencies):
+        for latency in latencies.tolist():
+            for estimator in self.estimators.values():
+                estimator.update(latency)
+        self.count += len(latencies)
+        if len(latencies):
+            self.max = max(self.max, float(latencies.max()))
+
+    def summary(self):
+        parts = [f'p{round(q * 100)} {estimator.value * 1000:.1f} ms' for q, estimator in self.estimators.items()]
+        return ', '.join(parts + [f'max {self.max * 1000:.1f} ms'])
+
+
+def _time_axis(chart, title):
+    x_axis = chart.get_default_x_axis()
+    x_axis.set_tick_strategy('DateTime')
+    x_axis.set_scroll_strategy('progressive')
+    x_axis.set_title('Date')
+    chart.get_default_y_axis().set_title(title)
+    return x_axis
+
+
+class LiveDashboard:
+    def __init__(self, engine=None, window_ms=DEFAULT_WINDOW_MS, max_samples=DEFAULT_MAX_SAMPLES):
+        self.engine = engine or StreamingEngine()
+        self.window_ms = window_ms
+        self.dashboard = lc.Dashboard(rows=2, columns=1, theme=lc.Themes.Dark)
+
+        chart = self.dashboard.ChartXY(column_index=0, row_index=0)
+        chart.set_title('Temperature & Detected Points')
+        self.temp_series = chart.add_line_series()
+        self.temp_series.set_name('Temperature')
+        # older samples drop out once the chart holds max_samples
+        self.temp_series.set_max_sample_count(max_samples)
+        self.alert_series = {}
+        # colours repeat when there are more detectors than ALERT_COLORS
+        for detector, color in zip(self.engine.detectors, cycle(ALERT_COLORS)):
+            series = chart.add_point_series()
+            series.set_name(DISPLAY_NAMES.get(detector.name, detector.name))
+            series.set_point_size(5)
+            series.set_point_color(color)
+            series.set_max_sample_count(max_samples)
+            self.alert_series[detector.name] = series
+        self.axes = [_time_axis(chart, 'Temperature')]
+        chart.add_legend()
+
+        chart = self.dashboard.ChartXY(column_index=0, row_index=1)
+        chart.set_title('ChangeFinder - Anomaly Score & Threshold')
+        self.score_series = chart.add_line_series()
+        self.score_series.set_name('Anomaly Score')
+        self.score_series.set_max_sample_count(max_samples)
+        self.threshold_series = chart.add_line_series()
+        self.threshold_series.set_name('Threshold')
+        self.threshold_series.set_dashed(pattern='Dashed')
+        self.threshold_series.set_line_color(lc.Color(255, 0, 0))  # Red color
+        self.threshold_series.set_max_sample_count(max_samples)
+        self.axes.append(_time_axis(chart, 'Anomaly Score'))
+        chart.add_legend()
+        self.started = False
+
+    def open(self):
+        for detector in self.engine.detectors:
+            if isinstance(detector, OnlineChangeFinder):
+                warm_up(detector.state.order)
+        self.dashboard.open(live=True)
+
+    def update(self, batch):
+        # returns the number of alerts in the batch
+        if not len(batch.values):
+            return 0
+        x = batch.timestamps.astype(np.float64)
+        if not self.started:
+            # the first batch fixes the visible window, progressive scrolling moves it along
+            for axis in self.axes:
+                axis.set_interval(start=x[0], end=x[0] + self.window_ms)
+            self.started = True
+        results = self.engine.score_batch(batch.values)
+        self.temp_series.add(x.tolist(), batch.values.tolist())
+        alerts = 0
+        for name, (scores, thresholds, flags) in results.items():
+            if flags.any():
+                self.alert_series[name].add(x[flags].tolist(), batch.values[flags].tolist())
+                alerts += int(flags.sum())
+        if 'changefinder' in results:
+            scores, thresholds, _ = results['changefinder']
+            thresholds = np.broadcast_to(thresholds, scores.shape)
+            # nothing to draw until the score and the learned threshold exist
+            ready = np.isfinite(scores) & np.isfinite(thresholds)
+            if ready.any():
+                self.score_series.add(x[ready].tolist(), scores[ready].tolist())
+                self.threshold_series.add(x[ready].tolist(), thresholds[ready].tolist())
+        return alerts
+
+
+def run(source, view, report_every=5.0):
+    latency = LatencyStats()
+    readings = alerts = 0
+    started = last_report = time.perf_counter()
+    for batch in source:
+        alerts += view.update(batch)
+        done = time.perf_counter()
+        latency.add(done - batch.ingested)
+        readings += len(batch.values)
+        if done - last_report >= report_every:
+            print(f'{readings} readings, {alerts} alerts, latency {latency.summary()}')
+            last_report = done
+    elapsed = time.perf_counter() - started
+    print(f'{readings} readings in {elapsed:.1f} s ({readings / max(elapsed, 1e-9):,.0f} readings/s), '
+          f'{alerts} alerts, ingest-to-chart latency {latency.summary()}')
+    return latency
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay or follow sensor readings on a live dashboard.')
+    parser.add_argument('--source', choices=['csv', 'tail', 'socket'], default='csv')
+    parser.add_argument('--path', default='machine_temperature_system_failure.csv',
+                        help='CSV to replay, or the file to follow with --source tail')
+    parser.add_argument('--speed', type=float, default=DEFAULT_SPEED,
+                        help='data seconds per wall-clock second for csv replay, 0 for as fast as possible')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--max-delay', type=float, default=DEFAULT_MAX_DELAY,
+                        help='longest a reading waits for its batch to fill, in seconds')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9009)
+    args = parser.parse_args(argv)
+
+    if args.source == 'csv':
+        source = csv_replay(args.path, args.speed, args.batch_size)
+    elif args.source == 'tail':
+        source = file_tail(args.path, args.batch_size, args.max_delay)
+    else:
+        source = socket_lines(args.host, args.port, args.batch_size, args.max_delay)
+    view = LiveDashboard()
+    view.open()
+    try:
+        run(source, view)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# Local Outlier Factor for a single feature
+# In 1-D the k nearest neighbours of a reading are a contiguous run of the sorted values, so the
+# values are sorted once, every reading's window start is found with a vectorized binary search,
+# and reachability distances are summed over fixed-size windows in chunks. Gives the same
+# negative_outlier_factor_ as sklearn's LocalOutlierFactor without building a tree or an n x k graph.
+# With many repeated values the tie at the k-th distance may be broken differently from sklearn's tree.
+import numpy as np
+
+# rows per chunk, sized so a chunk's (rows, k + 1) work arrays stay around 8 MB each
+CHUNK_ELEMENTS = 1 << 20
+
+
+def window_starts(s, k):
+    # s sorted; for every position i the start lo of the k + 1 consecutive values
+    # s[lo:lo + k + 1] that hold i and its k nearest neighbours
+    n = len(s)
+    i = np.arange(n)
+    lo = np.clip(i - k, 0, n - k - 1)
+    hi = np.clip(i, 0, n - k - 1)
+    # sliding the window right by one drops s[lo] and takes s[lo + k + 1]; worth it while the
+    # new value is strictly closer, which is true for a prefix of the candidate starts
+    while True:
+        active = lo < hi
+        if not active.any():
+            return lo
+        mid = (lo + hi) // 2
+        move = s[i] - s[mid] > s[np.minimum(mid + k + 1, n - 1)] - s[i]
+        lo = np.where(active & move, mid + 1, lo)
+        hi = np.where(active & ~move, mid, hi)
+
+
+def _window_sums(s, lo, k, row_values):
+    # per reading, the sum of row_values(rows, idx) over its window, leaving out the reading itself
+    n = len(s)
+    offsets = np.arange(k + 1)
+    sums = np.empty(n)
+    chunk = max(1, CHUNK_ELEMENTS // (k + 1))
+    for start in range(0, n, chunk):
+        rows = np.arange(start, min(start + chunk, n))
+        idx = lo[rows, None] + offsets
+        terms = row_values(rows, idx)
+        terms[idx == rows[:, None]] = 0.0
+        sums[rows] = terms.sum(axis=1)
+    return sums
+
+
+def local_outlier_factor(values, n_neighbors=20):
+    values = np.asarray(values, dtype=np.float64).ravel()
+    n = len(values)
+    k = max(1, min(n_neighbors, n - 1))
+    order = np.argsort(values, kind='stable')
+    s = values[order]
+
+    lo = window_starts(s, k)
+    k_distance = np.maximum(s - s[lo], s[lo + k] - s)
+
+    reach = _window_sums(s, lo, k, lambda rows, idx: np.maximum(k_distance[idx], np.abs(s[idx] - s[rows, None])))
+    lrd = 1.0 / (reach / k + 1e-10)
+    lof = _window_sums(s, lo, k, lambda rows, idx: lrd[idx]) / k / lrd
+
+    scores = np.empty(n)
+    scores[order] = -lof
+    return scores, k
+
+
+class LocalOutlierFactor1D:
+    # drop-in for LocalOutlierFactor(n_neighbors, contamination) in outlier-detection mode on one feature
+    def __init__(self, n_neighbors=20, contamination='auto'):
+        self.n_neighbors = n_neighbors
+        self.contamination = contamination
+
+    def fit(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 2 and X.shape[1] != 1:
+            raise ValueError(f'LocalOutlierFactor1D needs a single feature, got {X.shape[1]}')
+        self.negative_outlier_factor_, self.n_neighbors_ = local_outlier_factor(X.ravel(), self.n_neighbors)
+        self.n_samples_fit_ = len(self.negative_outlier_factor_)
+        if self.contamination == 'auto':
+            self.offset_ = -1.5
+        else:
+            self.offset_ = np.percentile(self.negative_outlier_factor_, 100.0 * self.contamination)
+        return self
+
+    def fit_predict(self, X):
+        self.fit(X)
+        return np.where(self.negative_outlier_factor_ < self.offset_, -1, 1)
@@ -0,0 +1,252 @@
+# Registry of fitted detectors for fit-once / score-many serving
+# A detector is fitted on a reference period and saved uncompressed with joblib next to a
+# meta.json. On a single feature an IsolationForest is a step function of the value, so it is
+# also compiled to sorted breakpoints plus one decision value per interval; those are loaded
+# memory-mapped and scoring is a binary search instead of a walk down 300 trees.
+# New readings are scored in fixed-size chunks, keeping memory flat however long the batch is.
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+
+from data_loader import CACHE_DIR_NAME, load_arrays
+from detectors import DEFAULT_PARAMS, DETECTORS
+from result_cache import data_fingerprint, library_versions
+
+DEFAULT_DIRECTORY = os.path.join(CACHE_DIR_NAME, 'models')
+DEFAULT_CHUNK_SIZE = 8192
+BENCH_BATCH_SIZES = (1, 12, 288, 2016, 8640)
+
+
+class StepScorer:
+    # decision_function of a 1-D model that is constant between breakpoints:
+    # interval i is (breaks[i - 1], breaks[i]], the last one is open to +inf
+    def __init__(self, breaks, table):
+        self.breaks = breaks
+        self.table = table
+
+    def decision_function(self, X):
+        # the trees compare float32 inputs, so do the same
+        x = np.asarray(X, dtype=np.float32).reshape(-1)
+        return np.asarray(self.table[np.searchsorted(self.breaks, x, side='left')], dtype=np.float64)
+
+
+def compile_isolation_forest(model):
+    thresholds = np.concatenate([
+        tree.tree_.threshold[tree.tree_.children_left != -1] for tree in model.estimators_
+    ])
+    # a float32 reading x goes left when x <= t, i.e. when x <= the largest float32 not above t
+    breaks = thresholds.astype(np.float32)
+    above = breaks.astype(np.float64) > thresholds
+    breaks[above] = np.nextafter(breaks[above], np.float32(-np.inf))
+    breaks = np.unique(breaks)
+    if len(breaks) == 0:
+        # fitted on constant readings, e.g. a stuck sensor: no tree splits, one score everywhere
+        return StepScorer(breaks, model.decision_function(np.zeros((1, 1))))
+    # each breakpoint lies in its own interval, one float32 step past the last covers the tail
+    representatives = np.append(breaks, np.nextafter(breaks[-1], np.float32(np.inf)))
+    return StepScorer(breaks, model.decision_function(representatives.reshape(-1, 1)))
+
+
+def _compile(model):
+    from sklearn.ensemble import IsolationForest
+
+    if isinstance(model, IsolationForest) and model.n_features_in_ == 1:
+        return compile_isolation_forest(model)
+    return None
+
+
+def _model_dir(name, directory):
+    return os.path.join(directory, name)
+
+
+def save_model(name, model, metadata, directory=DEFAULT_DIRECTORY):
+    path = _model_dir(name, directory)
+    os.makedirs(path, exist_ok=True)
+    steps = _compile(model)
+    metadata = {**metadata, 'compiled': steps is not None}
+    tmp_suffix = f'.{os.getpid()}.tmp'
+    # compress=0 keeps the arrays as raw blocks in the file, so they can be memory-mapped
+    joblib.dump(model, os.path.join(path, 'model.joblib' + tmp_suffix), compress=0)
+    files = ['model.joblib']
+    if steps is not None:
+        for file_name, array in (('breaks.npy', steps.breaks), ('table.npy', steps.table)):
+            with open(os.path.join(path, file_name + tmp_suffix), 'wb') as f:
+                np.save(f, array)
+            files.append(file_name)
+    with open(os.path.join(path, 'meta.json' + tmp_suffix), 'w') as f:
+        json.dump(metadata, f, indent=2, default=str)
+    # meta.json goes last, a model only shows up in the registry once everything else is in place
+    for file_name in files + ['meta.json']:
+        os.replace(os.path.join(path, file_name + tmp_suffix), os.path.join(path, file_name))
+    return path
+
+
+def load_metadata(name, directory=DEFAULT_DIRECTORY):
+    with open(os.path.join(_model_dir(name, directory), 'meta.json')) as f:
+        return json.load(f)
+
+
+def load_model(name, directory=DEFAULT_DIRECTORY, mmap_mode='r', compiled=True):
+    # compiled=False returns the original estimator, e.g. to inspect or refit it
+    path = _model_dir(name, directory)
+    metadata = load_metadata(name, directory)
+    if compiled and metadata.get('compiled'):
+        model = StepScorer(np.load(os.path.join(path, 'breaks.npy'), mmap_mode=mmap_mode),
+                           np.load(os.path.join(path, 'table.npy'), mmap_mode=mmap_mode))
+    else:
+        model = joblib.load(os.path.join(path, 'model.joblib'), mmap_mode=mmap_mode)
+    return model, metadata
+
+
+def list_models(directory=DEFAULT_DIRECTORY):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(entry.name for entry in os.scandir(directory)
+                  if os.path.isfile(os.path.join(entry.path, 'meta.json')))
+
+
+def fit_reference(name, values, timestamps=None, detector='iforest', start=None, end=None,
+                  directory=DEFAULT_DIRECTORY, **params):
+    # start / end are epoch ms bounds of the reference period, both inclusive
+    values = np.asarray(values, dtype=np.float64)
+    if timestamps is not None and (start is not None or end is not None):
+        timestamps = np.asarray(timestamps)
+        keep = np.ones(len(values), dtype=bool)
+        if start is not None:
+            keep &= timestamps >= start
+        if end is not None:
+            keep &= timestamps <= end
+        values, timestamps = values[keep], timestamps[keep]
+    if len(values) == 0:
+        raise ValueError('reference period holds no readings')
+
+    params = {**DEFAULT_PARAMS[detector], **params}
+    result = DETECTORS[detector](values, **params)
+    if result.model is None:
+        raise ValueError(f'{detector} keeps no fitted model and cannot be served')
+    metadata = {
+        'name': name,
+        'detector': detector,
+        'params': params,
+        'fitted_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'n_train': len(values),
+        'train_start_ms': int(timestamps[0]) if timestamps is not None else None,
+        'train_end_ms': int(timestamps[-1]) if timestamps is not None else None,
+        'data_fingerprint': data_fingerprint(values),
+        'libraries': library_versions(),
+        # every served detector flags negative decision_function scores
+        'threshold': 0.0,
+        'train_anomaly_rate': float(np.mean(result.labels)),
+    }
+    save_model(name, result.model, metadata, directory)
+    return result.model, metadata
+
+
+def score_chunks(model, values, chunk_size=DEFAULT_CHUNK_SIZE):
+    # yields (start, scores) per chunk of at most chunk_size readings
+    values = np.asarray(values, dtype=np.float64)
+    for start in range(0, len(values), chunk_size):
+        yield start, model.decision_function(values[start:start + chunk_size].reshape(-1, 1))
+
+
+def score(model, values, chunk_size=DEFAULT_CHUNK_SIZE, out=None):
+    if out is None:
+        out = np.empty(len(values))
+    for start, scores in score_chunks(model, values, chunk_size):
+        out[start:start + len(scores)] = scores
+    return out
+
+
+def benchmark_latency(model, values, batch_sizes=BENCH_BATCH_SIZES, repeats=50):
+    values = np.asarray(values, dtype=np.float64)
+    rng = np.random.default_rng(0)
+    report = {}
+    for batch_size in batch_sizes:
+        batch_size = min(batch_size, len(values))
+        timings = np.empty(repeats)
+        for i in range(repeats):
+            start = rng.integers(0, len(values) - batch_size + 1)
+            batch = values[start:start + batch_size]
+            began = time.perf_counter()
+            score(model, batch)
+            timings[i] = time.perf_counter() - began
+        report[batch_size] = {
+            'p50_ms': float(np.percentile(timings, 50) * 1000),
+            'p95_ms': float(np.percentile(timings, 95) * 1000),
+            'readings_per_s': float(batch_size / np.median(timings)),
+        }
+    return report
+
+
+def _to_ms(text):
+    from anomaly_labels import to_epoch_ms
+
+    return None if text is None else int(to_epoch_ms([text])[0])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fit, store and serve anomaly detectors.')
+    parser.add_argument('--directory', default=DEFAULT_DIRECTORY)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    fit = commands.add_parser('fit', help='fit a detector on a reference period and save it')
+    fit.add_argument('name')
+    fit.add_argument('csv')
+    fit.add_argument('--detector', default='iforest', choices=['iforest', 'ocsvm'])
+    fit.add_argument('--start', help='first reference timestamp, e.g. 2013-12-02')
+    fit.add_argument('--end', help='last reference timestamp')
+
+    score_cmd = commands.add_parser('score', help='score a CSV with a saved detector')
+    score_cmd.add_argument('name')
+    score_cmd.add_argument('csv')
+    score_cmd.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    score_cmd.add_argument('--output', help='write the scores to this .npy file')
+
+    bench = commands.add_parser('bench', help='per-batch scoring latency of a saved detector')
+    bench.add_argument('name')
+    bench.add_argument('csv')
+    bench.add_argument('--batch-sizes', type=int, nargs='+', default=list(BENCH_BATCH_SIZES))
+    bench.add_argument('--repeats', type=int, default=50)
+
+    commands.add_parser('list', help='list saved detectors')
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        for name in list_models(args.directory):
+            meta = load_metadata(name, args.directory)
+            print(f"{name:<20}{meta['detector']:<10}{meta['n_train']:>10} readings  fitted {meta['fitted_at']}")
+        return
+
+    timestamps, values = load_arrays(args.csv)
+    if args.command == 'fit':
+        began = time.perf_counter()
+        _, meta = fit_reference(args.name, values, timestamps, args.detector,
+                                _to_ms(args.start), _to_ms(args.end), args.directory)
+        print(f"fitted {args.name} ({meta['detector']}) on {meta['n_train']} readings "
+              f'in {time.perf_counter() - began:.2f} s')
+        return
+
+    began = time.perf_counter()
+    model, meta = load_model(args.name, args.directory)
+    print(f'loaded {args.name} in {(time.perf_counter() - began) * 1000:.1f} ms')
+    if args.command == 'score':
+        began = time.perf_counter()
+        scores = score(model, values, args.chunk_size)
+        elapsed = time.perf_counter() - began
+        flagged = int(np.count_nonzero(scores < meta['threshold']))
+        print(f'{len(values)} readings in {elapsed:.2f} s ({len(values) / elapsed:,.0f} readings/s), {flagged} flagged')
+        if args.output:
+            np.save(args.output, scores)
+    else:
+        print(f"{'batch':>8}{'p50 ms':>10}{'p95 ms':>10}{'readings/s':>14}")
+        for batch_size, row in benchmark_latency(model, values, args.batch_sizes, args.repeats).items():
+            print(f"{batch_size:>8}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['readings_per_s']:>14,.0f}")
+
+
+if __name__ == '__main__':
+    main()
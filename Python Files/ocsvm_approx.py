@@ -0,0 +1,65 @@
+# Scalable approximations of the One-Class SVM detector
+# 'nystroem' maps values through a Nystroem RBF feature map and fits a linear SGD one-class SVM,
+# 'sample' fits the exact kernel model on a random sample and scores every reading with it.
+import sys
+import time
+
+import numpy as np
+
+MODES = ('exact', 'nystroem', 'sample')
+
+
+def fit_ocsvm(values, nu, gamma, kernel, mode='exact', n_components=300, sample_size=10000, random_state=42):
+    from sklearn.svm import OneClassSVM
+
+    X = np.asarray(values, dtype=np.float64).reshape(-1, 1)
+    if mode == 'exact':
+        return OneClassSVM(nu=nu, gamma=gamma, kernel=kernel).fit(X)
+    if mode == 'sample':
+        rng = np.random.default_rng(random_state)
+        if len(X) > sample_size:
+            X = X[np.sort(rng.choice(len(X), sample_size, replace=False))]
+        return OneClassSVM(nu=nu, gamma=gamma, kernel=kernel).fit(X)
+    if mode == 'nystroem':
+        from sklearn.kernel_approximation import Nystroem
+        from sklearn.linear_model import SGDOneClassSVM
+        from sklearn.pipeline import make_pipeline
+
+        return make_pipeline(
+            Nystroem(kernel=kernel, gamma=gamma, n_components=min(n_components, len(X)), random_state=random_state),
+            SGDOneClassSVM(nu=nu, random_state=random_state),
+        ).fit(X)
+    raise ValueError(f'unknown One-Class SVM mode {mode!r}, expected one of {MODES}')
+
+
+def fidelity_report(values, modes=('nystroem', 'sample'), nu=0.2, gamma=0.001, kernel='rbf', **options):
+    X = np.asarray(values, dtype=np.float64).reshape(-1, 1)
+    report = {}
+    for mode in ('exact',) + tuple(modes):
+        start = time.perf_counter()
+        model = fit_ocsvm(X, nu, gamma, kernel, mode=mode, **options)
+        fitted = time.perf_counter()
+        labels = model.decision_function(X) < 0
+        scored = time.perf_counter()
+        report[mode] = {'fit_s': fitted - start, 'score_s': scored - fitted, 'labels': labels}
+
+    exact = report['exact']['labels']
+    for mode, row in report.items():
+        labels = row.pop('labels')
+        both = np.count_nonzero(labels & exact)
+        row['anomalies'] = int(labels.sum())
+        row['agreement'] = float(np.mean(labels == exact))
+        row['precision'] = both / labels.sum() if labels.any() else float('nan')
+        row['recall'] = both / exact.sum() if exact.any() else float('nan')
+    return report
+
+
+if __name__ == '__main__':
+    from data_loader import load_arrays
+
+    _, values = load_arrays(sys.argv[1] if len(sys.argv) > 1 else 'machine_temperature_system_failure.csv')
+    print(f'{len(values)} readings, labels compared against the exact model')
+    print(f"{'mode':<10}{'fit s':>9}{'score s':>9}{'anomalies':>11}{'agreement':>11}{'precision':>11}{'recall':>9}")
+    for mode, row in fidelity_report(values).items():
+        print(f"{mode:<10}{row['fit_s']:>9.2f}{row['score_s']:>9.2f}{row['anomalies']:>11}"
+              f"{row['agreement']:>11.4f}{row['precision']:>11.4f}{row['recall']:>9.4f}")
@@ -0,0 +1,196 @@
+# Out-of-core processing of sensor histories larger than memory
+# The CSV is converted chunk by chunk into the fixed-width .npy columns of the binary cache
+# (data_loader.build_cache_chunked), which can also be memory-mapped for random access. Everything
+# here reads those columns back in chunks, in three passes:
+#   1. calendar aggregates, value moments and the first timestamp
+#   2. heatmap grid, written a day at a time as days finish (so readings must be in time order),
+#      and the detectors that need only running state: Hotelling's T² and the sigma
+#      band from the pass-1 moments, ChangeFinder carrying its state across chunks. Scores and labels
+#      are appended to .npy columns and each score column feeds a quantile sketch
+#   3. score histograms over the sketched ranges and ChangeFinder's labels from the sketched IQR
+# Only the chunk in flight and fixed-size state are held, so peak RSS does not grow with history.
+import argparse
+import os
+import time
+
+import numpy as np
+
+from calendar_store import CalendarStore
+from data_loader import CHUNK_ROWS, ColumnWriter, cache_dir_for, cached_columns, column_chunks
+from detectors import DEFAULT_PARAMS, changefinder_threshold
+from heatmap_grid import DAY_MS, HeatmapWriter
+from instrumentation import peak_rss_kb, stage
+from sketches import FixedHistogram, KLLSketch
+
+STREAMING_DETECTORS = ('hotelling', 'variance', 'changefinder')
+DEFAULT_OUTPUT = os.path.join('results', 'out_of_core.npz')
+
+
+def chunks(columns, chunk_rows=CHUNK_ROWS):
+    # (timestamps, values) chunks of the two cache columns in lockstep
+    return zip(column_chunks(columns['timestamp_ms'], chunk_rows), column_chunks(columns['value'], chunk_rows))
+
+
+def first_pass(columns, chunk_rows=CHUNK_ROWS):
+    # calendar store, (count, mean, sample std) and the first timestamp in one read
+    calendar = CalendarStore()
+    count, mean, m2 = 0, 0.0, 0.0
+    first = np.iinfo(np.int64).max
+    for timestamps, values in chunks(columns, chunk_rows):
+        calendar.add(timestamps, values)
+        first = min(first, int(timestamps.min()))
+        # Chan et al.: merge the chunk's mean and squared deviations into the running ones
+        n = len(values)
+        chunk_mean = float(values.mean())
+        chunk_m2 = float(np.square(values - chunk_mean).sum())
+        delta = chunk_mean - mean
+        mean += delta * n / (count + n)
+        m2 += chunk_m2 + delta * delta * count * n / (count + n)
+        count += n
+    return calendar, (count, mean, float(np.sqrt(m2 / (count - 1)))), first
+
+
+class ChunkScorer:
+    # batch-equivalent scores of one detector, a chunk at a time
+    def __init__(self, name, mean, std, params=None):
+        self.name = name
+        self.params = {**DEFAULT_PARAMS[name], **(params or {})}
+        self.mean, self.std = mean, std
+        self.threshold = None
+        if name == 'hotelling':
+            from scipy.stats import chi2
+
+            self.threshold = chi2.ppf(q=self.params['q'], df=1)
+        elif name == 'variance':
+            self.threshold = self.params['n_sigma']
+        elif name == 'changefinder':
+            from cf_kernel import ChangeFinderState
+
+            self.state = ChangeFinderState(self.params['r'], self.params['order'], self.params['smooth'])
+        else:
+            raise ValueError(f'{name} needs the whole series at once, out-of-core detectors are {STREAMING_DETECTORS}')
+
+    def scores(self, values):
+        if self.name == 'changefinder':
+            return self.state.update(values)[0]
+        z = (values - self.mean) / self.std
+        return z * z if self.name == 'hotelling' else z
+
+    def labels(self, scores):
+        # ChangeFinder's threshold is only known once every score is sketched, see third_pass
+        if self.name == 'variance':
+            return np.abs(scores) > self.threshold
+        return scores > self.threshold
+
+
+def second_pass(columns, directory, moments, first_ms, detectors=STREAMING_DETECTORS, chunk_rows=CHUNK_ROWS):
+    # <directory>/heatmap.npy, <name>_score.npy and, where the threshold is fixed, <name>_label.npy
+    # per detector; returns the heatmap writer and {name: (scorer, sketch)}
+    _, mean, std = moments
+    scorers = {name: ChunkScorer(name, mean, std) for name in detectors}
+    sketches = {name: KLLSketch() for name in detectors}
+    grid = HeatmapWriter(os.path.join(directory, 'heatmap.npy'), first_ms // DAY_MS * DAY_MS)
+    writers = {'heatmap': grid}
+    try:
+        for name, scorer in scorers.items():
+            writers[name + '_score'] = ColumnWriter(os.path.join(directory, name + '_score.npy'), np.float64)
+            if scorer.threshold is not None:
+                writers[name + '_label'] = ColumnWriter(os.path.join(directory, name + '_label.npy'), bool)
+        for timestamps, values in chunks(columns, chunk_rows):
+            grid.update(timestamps, values)
+            for name, scorer in scorers.items():
+                scores = scorer.scores(values)
+                writers[name + '_score'].append(scores)
+                sketches[name].update(scores)
+                if scorer.threshold is not None:
+                    writers[name + '_label'].append(scorer.labels(scores))
+    except BaseException:
+        for writer in writers.values():
+            writer.abort()
+        raise
+    # the heatmap's gap fill is a mean over every cell, so it is settled in close()
+    for writer in writers.values():
+        writer.close()
+    return grid, {name: (scorers[name], sketches[name]) for name in detectors}
+
+
+def third_pass(directory, scored, bins=50, chunk_rows=CHUNK_ROWS):
+    # {name: histogram} over each score column's [min, max]; writes changefinder_label.npy
+    histograms = {}
+    for name, (scorer, sketch) in scored.items():
+        histograms[name] = FixedHistogram(sketch.min, sketch.max, bins)
+        labels = None
+        if scorer.threshold is None:
+            scorer.threshold = changefinder_threshold(sketch, scorer.params['iqr_factor'])
+            labels = ColumnWriter(os.path.join(directory, name + '_label.npy'), bool)
+        try:
+            for scores in column_chunks(os.path.join(directory, name + '_score.npy'), chunk_rows):
+                histograms[name].update(scores)
+                if labels is not None:
+                    labels.append(scorer.labels(scores))
+        except BaseException:
+            if labels is not None:
+                labels.abort()
+            raise
+        if labels is not None:
+            labels.close()
+    return histograms
+
+
+def run(file_path, detectors=STREAMING_DETECTORS, chunk_rows=CHUNK_ROWS, cache_dir=None, bins=50):
+    # everything compute.compute_all gives for these detectors, with score and label columns left
+    # on disk next to the cache; returns (arrays for write_results, {column: .npy path})
+    directory = os.path.join(cache_dir_for(file_path, cache_dir), 'out_of_core')
+    os.makedirs(directory, exist_ok=True)
+    columns = cached_columns(file_path, cache_dir, chunk_rows)
+    with stage('out_of_core:first_pass'):
+        calendar, moments, first_ms = first_pass(columns, chunk_rows)
+    with stage('out_of_core:second_pass', rows=moments[0]):
+        grid, scored = second_pass(columns, directory, moments, first_ms, detectors, chunk_rows)
+    with stage('out_of_core:third_pass', rows=moments[0]):
+        histograms = third_pass(directory, scored, bins, chunk_rows)
+
+    arrays = {
+        'rows': moments[0],
+        'calendar': calendar.stats('month'),
+        'heatmap_origin_ms': grid.origin_ms,
+        'heatmap_fill_value': grid.fill_value,
+    }
+    for name, (scorer, sketch) in scored.items():
+        arrays[f'{name}_threshold'] = scorer.threshold
+        arrays[f'{name}_quartiles'] = sketch.quantiles([0.25, 0.5, 0.75])
+        arrays[f'{name}_histogram'] = {'counts': histograms[name].counts, 'edges': histograms[name].edges}
+    paths = {f'{name}_{kind}': os.path.join(directory, f'{name}_{kind}.npy')
+             for name in detectors for kind in ('score', 'label')}
+    paths['heatmap'] = grid.path
+    return arrays, paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Chunked, bounded-memory processing of a sensor CSV.')
+    parser.add_argument('csv', nargs='?', default='machine_temperature_system_failure.csv')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--detectors', default=','.join(STREAMING_DETECTORS), help='comma separated')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='.npz for the aggregates and thresholds')
+    args = parser.parse_args(argv)
+
+    from compute import write_results
+
+    detectors = tuple(name.strip() for name in args.detectors.split(',') if name.strip())
+    unknown = sorted(set(detectors) - set(STREAMING_DETECTORS))
+    if unknown:
+        parser.error(f"not available out of core: {', '.join(unknown)}")
+    began = time.perf_counter()
+    arrays, _ = run(args.csv, detectors, args.chunk_rows)
+    write_results(args.output, **arrays)
+    seconds = time.perf_counter() - began
+    print(f"{arrays['rows']:,} readings ({os.path.getsize(args.csv) / 2 ** 20:,.0f} MiB of CSV) in {seconds:.1f} s, "
+          f"{arrays['rows'] / seconds:,.0f} rows/s")
+    peak = peak_rss_kb()
+    if peak is not None:
+        print(f'peak RSS {peak / 1024:,.0f} MiB with {args.chunk_rows:,}-row chunks')
+    print(f"aggregates written to {args.output}, scores and labels in {os.path.join(cache_dir_for(args.csv), 'out_of_core')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+# Multi-resolution min/max/mean pyramid for zoomable time-series charts
+# Level 0 is the raw series; every level above merges `factor` buckets of the one below, up to a
+# top level of at most min_buckets buckets. Levels are float32 .npy files next to the data cache,
+# memory-mapped on open, so a chart reads only the tiles covering the range it shows.
+# Every column is stored with a key: the CSV's cache meta for the file's own columns, the result
+# cache key for detector scores. A column whose key still matches is not read or rewritten.
+import json
+import os
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+from data_loader import cache_dir_for, cache_meta, load_arrays
+from instrumentation import timed
+from result_cache import data_fingerprint
+
+PYRAMID_VERSION = 2
+DEFAULT_FACTOR = 4
+DEFAULT_MIN_BUCKETS = 512
+DEFAULT_MAX_POINTS = 2000
+
+Tile = namedtuple('Tile', ['level', 'x', 'low', 'high', 'mean'])
+
+
+def _merge(low, high, total, count, factor):
+    pad = -len(low) % factor
+    if pad:
+        low = np.append(low, np.full(pad, np.inf))
+        high = np.append(high, np.full(pad, -np.inf))
+        total = np.append(total, np.zeros(pad))
+        count = np.append(count, np.zeros(pad, dtype=count.dtype))
+    return (low.reshape(-1, factor).min(axis=1), high.reshape(-1, factor).max(axis=1),
+            total.reshape(-1, factor).sum(axis=1), count.reshape(-1, factor).sum(axis=1))
+
+
+def build_levels(values, factor=DEFAULT_FACTOR, min_buckets=DEFAULT_MIN_BUCKETS):
+    # [(low, high, mean, count)] for levels 1 and up
+    low = high = total = np.asarray(values, dtype=np.float64)
+    count = np.ones(len(low), dtype=np.int64)
+    levels = []
+    while len(low) > min_buckets:
+        low, high, total, count = _merge(low, high, total, count, factor)
+        levels.append((low, high, total / count, count))
+    return levels
+
+
+def level_count(rows, factor=DEFAULT_FACTOR, min_buckets=DEFAULT_MIN_BUCKETS):
+    levels = 1
+    while rows > min_buckets:
+        rows = -(-rows // factor)
+        levels += 1
+    return levels
+
+
+def bucket_centres(timestamps, bucket):
+    # midpoint between the first and last reading of every bucket of `bucket` readings
+    starts = np.arange(0, len(timestamps), bucket)
+    ends = np.minimum(starts + bucket, len(timestamps)) - 1
+    return (timestamps[starts].astype(np.float64) + timestamps[ends]) / 2
+
+
+class Pyramid:
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'index.json')) as f:
+            self.index = json.load(f)
+        self._arrays = {}
+
+    @classmethod
+    def build(cls, timestamps, directory, factor=DEFAULT_FACTOR, min_buckets=DEFAULT_MIN_BUCKETS, key=None):
+        # key identifies the timestamps; without one they are hashed
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        index_path = os.path.join(directory, 'index.json')
+        fingerprint = key or data_fingerprint(timestamps)
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = None
+        if (index is None or index.get('version') != PYRAMID_VERSION or index.get('source') != fingerprint
+                or index.get('factor') != factor or index.get('min_buckets') != min_buckets):
+            os.makedirs(directory, exist_ok=True)
+            n_levels = level_count(len(timestamps), factor, min_buckets)
+            _save(directory, 'L0_time.npy', timestamps.astype(np.float64))
+            for level in range(1, n_levels):
+                _save(directory, f'L{level}_time.npy', bucket_centres(timestamps, factor ** level))
+            index = {
+                'version': PYRAMID_VERSION,
+                'source': fingerprint,
+                'factor': factor,
+                'min_buckets': min_buckets,
+                'rows': len(timestamps),
+                'levels': n_levels,
+                'columns': {},
+            }
+            _write_index(directory, index)
+        return cls(directory)
+
+    @classmethod
+    @timed('pyramid')
+    def for_file(cls, file_path, cache_dir=None, detectors=(), **options):
+        # pyramid of the 'value' column, kept with the binary cache of the CSV, plus a
+        # '<name>_score' column per detector in `detectors` (default parameters)
+        meta = cache_meta(file_path, cache_dir)
+        key = f"{meta['sha1']}:{meta['size']}"
+        # memory-mapped: an up-to-date pyramid never reads the columns
+        timestamps, values = load_arrays(file_path, cache_dir=cache_dir, mmap_mode='r')
+        pyramid = cls.build(timestamps, os.path.join(cache_dir_for(file_path, cache_dir), 'pyramid'), key=key, **options)
+        pyramid.add_column('value', values, key=key)
+        for name in detectors:
+            pyramid.add_scores(name, values)
+        return pyramid
+
+    @property
+    def levels(self):
+        return self.index['levels']
+
+    @property
+    def columns(self):
+        return list(self.index['columns'])
+
+    def add_column(self, name, values, key=None):
+        # key identifies the values, without one they are hashed; a column with the same key is not rewritten
+        fingerprint = key or data_fingerprint(np.asarray(values, dtype=np.float64))
+        if self.index['columns'].get(name) == fingerprint:
+            return
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) != self.index['rows']:
+            raise ValueError(f'column {name!r} has {len(values)} rows, the pyramid has {self.index["rows"]}')
+        _save(self.directory, f'L0_{name}.npy', values.astype(np.float32))
+        for level, (low, high, mean, _) in enumerate(build_levels(values, self.index['factor'],
+                                                                  self.index['min_buckets']), 1):
+            _save(self.directory, f'L{level}_{name}_low.npy', low.astype(np.float32))
+            _save(self.directory, f'L{level}_{name}_high.npy', high.astype(np.float32))
+            _save(self.directory, f'L{level}_{name}_mean.npy', mean.astype(np.float32))
+        self.index['columns'][name] = fingerprint
+        for key in [key for key in self._arrays if key.startswith(f'{name}:')]:
+            del self._arrays[key]
+        _write_index(self.directory, self.index)
+
+    def add_scores(self, name, values, params=None, cache=None, label=None):
+        # '<label>_score' column of a detector's scores on `values`, keyed on its result cache key,
+        # so it is only re-aggregated (and the detector only run or loaded) when that key changes
+        from detectors import DEFAULT_PARAMS, run_detector
+        from result_cache import ResultCache
+
+        cache = ResultCache() if cache is None else cache
+        params = {**DEFAULT_PARAMS[name], **(params or {})}
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        column = f'{label or name}_score'
+        key = cache.key(name, values, params)
+        if self.index['columns'].get(column) != key:
+            self.add_column(column, run_detector(name, values, cache=cache, **params).scores, key=key)
+        return column
+
+    def _array(self, file_name, key):
+        if key not in self._arrays:
+            self._arrays[key] = np.load(os.path.join(self.directory, file_name), mmap_mode='r')
+        return self._arrays[key]
+
+    def times(self, level):
+        return self._array(f'L{level}_time.npy', f':time{level}')
+
+    def choose_level(self, t0, t1, max_points=DEFAULT_MAX_POINTS):
+        # finest level that shows [t0, t1] in at most max_points buckets
+        for level in range(self.levels):
+            times = self.times(level)
+            if np.searchsorted(times, t1, 'right') - np.searchsorted(times, t0, 'left') <= max_points:
+                return level
+        return self.levels - 1
+
+    def query(self, column, t0=None, t1=None, max_points=DEFAULT_MAX_POINTS, level=None):
+        if column not in self.index['columns']:
+            raise KeyError(f'no pyramid column {column!r}, have {self.columns}')
+        first = self.times(0)
+        t0 = first[0] if t0 is None else t0
+        t1 = first[-1] if t1 is None else t1
+        if level is None:
+            level = self.choose_level(t0, t1, max_points)
+        times = self.times(level)
+        # one bucket either side so the line runs to the edges of the range
+        i0 = max(np.searchsorted(times, t0, 'left') - 1, 0)
+        i1 = min(np.searchsorted(times, t1, 'right') + 1, len(times))
+        if level == 0:
+            raw = self._array(f'L0_{column}.npy', f'{column}:0')[i0:i1]
+            return Tile(0, times[i0:i1], raw, raw, raw)
+        low, high, mean = (self._array(f'L{level}_{column}_{stat}.npy', f'{column}:{level}:{stat}')[i0:i1]
+                           for stat in ('low', 'high', 'mean'))
+        return Tile(level, times[i0:i1], low, high, mean)
+
+
+def _save(directory, file_name, array):
+    path = os.path.join(directory, file_name)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def _write_index(directory, index):
+    path = os.path.join(directory, 'index.json')
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class PyramidView:
+    # a min/max band plus a mean line fed from a pyramid; show() swaps in the tiles for a range.
+    # lightningchart does not report axis changes back to Python, so the caller decides when to zoom.
+    def __init__(self, chart, pyramid, column='value', max_points=DEFAULT_MAX_POINTS, name='Temperature'):
+        self.chart = chart
+        self.pyramid = pyramid
+        self.column = column
+        self.max_points = max_points
+        self.band = chart.add_area_range_series()
+        self.band.set_name(f'{name} min/max')
+        self.line = chart.add_line_series()
+        self.line.set_name(name)
+        self.level = None
+
+    def show(self, t0=None, t1=None):
+        tile = self.pyramid.query(self.column, t0, t1, self.max_points)
+        self.band.clear()
+        self.line.clear()
+        if tile.level > 0:
+            self.band.add_dict_data([
+                {'position': x, 'low': low, 'high': high}
+                for x, low, high in zip(tile.x.tolist(), tile.low.tolist(), tile.high.tolist())
+            ])
+        self.line.add(tile.x.tolist(), tile.mean.tolist())
+        x_axis = self.chart.get_default_x_axis()
+        x_axis.set_interval(start=tile.x[0] if t0 is None else t0, end=tile.x[-1] if t1 is None else t1)
+        self.level = tile.level
+        return tile
+
+
+if __name__ == '__main__':
+    import time
+
+    import lightningchart as lc
+
+    from anomaly_labels import to_epoch_ms
+
+    lc.set_license('my-license-key')
+    file_path = sys.argv[1] if len(sys.argv) > 1 else 'machine_temperature_system_failure.csv'
+    start = time.perf_counter()
+    pyramid = Pyramid.for_file(file_path)
+    print(f'pyramid with {pyramid.levels} levels ready in {(time.perf_counter() - start) * 1000:.1f} ms')
+
+    chart = lc.ChartXY(theme=lc.Themes.Dark, title='Temperature')
+    chart.get_default_x_axis().set_tick_strategy('DateTime')
+    view = PyramidView(chart, pyramid)
+    view.show()
+    chart.open(live=True)
+    print(f'showing level {view.level}; enter "<start> <end>" to zoom, an empty line for everything, q to quit')
+    for line in sys.stdin:
+        parts = line.split()
+        if parts == ['q']:
+            break
+        if len(parts) not in (0, 2):
+            print('expected "<start> <end>", e.g. 2014-02-01 2014-02-08')
+            continue
+        t0, t1 = to_epoch_ms(parts) if parts else (None, None)
+        start = time.perf_counter()
+        tile = view.show(t0, t1)
+        print(f'level {tile.level}, {len(tile.x)} buckets in {(time.perf_counter() - start) * 1000:.1f} ms')
+    chart.close()
@@ -0,0 +1,136 @@
+# Persistent memoization of detector results
+# Entries are keyed by (data fingerprint, detector name, hyperparameters, library versions) and
+# evicted least-recently-used first once the cache grows past max_bytes.
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from importlib import metadata
+
+import numpy as np
+
+from data_loader import CACHE_DIR_NAME
+
+DEFAULT_DIRECTORY = os.path.join(CACHE_DIR_NAME, 'results')
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+# results also kept in memory, least recently used dropped first
+DEFAULT_MEMORY_ENTRIES = 32
+LIBRARIES = ('numpy', 'scikit-learn', 'scipy', 'numba')
+# bump when a detector's output changes without any library version changing
+CACHE_VERSION = 1
+
+
+def data_fingerprint(values):
+    values = np.ascontiguousarray(values)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f'{values.dtype.str}{values.shape}'.encode())
+    digest.update(values.view(np.uint8).data)
+    return digest.hexdigest()
+
+
+def library_versions():
+    versions = {}
+    for name in LIBRARIES:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+class ResultCache:
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES, memory_entries=DEFAULT_MEMORY_ENTRIES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.versions = library_versions()
+        self._memory = OrderedDict()
+        # the compute graph and the sweep runner call one cache from several threads
+        self._memory_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, name, values, params):
+        payload = {
+            'version': CACHE_VERSION,
+            'data': data_fingerprint(values),
+            'detector': name,
+            'params': params,
+            'libraries': self.versions,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.joblib')
+
+    def get(self, key):
+        with self._memory_lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        import joblib
+
+        path = self._path(key)
+        try:
+            result = joblib.load(path)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError, AttributeError, ImportError):
+            # missing, truncated, or pickled against code that has since changed: recompute
+            return None
+        # mtime doubles as the last-used time for LRU eviction; the entry may have been evicted
+        # since it was read, the result is still good
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self._remember(key, result)
+        return result
+
+    def _remember(self, key, result):
+        with self._memory_lock:
+            self._memory[key] = result
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def put(self, key, result):
+        import joblib
+
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        joblib.dump(result, tmp_path)
+        os.replace(tmp_path, path)
+        self._remember(key, result)
+        self.evict()
+
+    def entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.joblib'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # evicted by another thread or process since the scan
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def get_or_compute(self, name, values, params, compute):
+        key = self.key(name, values, params)
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            self.put(key, result)
+        return result
@@ -0,0 +1,68 @@
+# Compact scores and labels of several detectors over one series
+# Scores live in a single float32 (rows x detectors) matrix in column-major order, so every
+# detector's scores are one contiguous column, and labels are bit-packed, one row of bits per
+# detector. Charts take views and index arrays from it instead of per-detector DataFrame copies.
+import numpy as np
+
+
+class ScoreMatrix:
+    def __init__(self, names, scores, packed_labels, n_rows):
+        self.names = list(names)
+        self._columns = {name: i for i, name in enumerate(self.names)}
+        self.scores_matrix = scores
+        self.packed_labels = packed_labels
+        self.n_rows = n_rows
+
+    @classmethod
+    def from_results(cls, results):
+        # results: {name: DetectorResult}, all over the same rows
+        names = list(results)
+        n_rows = len(next(iter(results.values())).scores) if names else 0
+        scores = np.empty((n_rows, len(names)), dtype=np.float32, order='F')
+        packed = np.empty((len(names), (n_rows + 7) // 8), dtype=np.uint8)
+        for i, name in enumerate(names):
+            result = results[name]
+            if len(result.scores) != n_rows or len(result.labels) != n_rows:
+                raise ValueError(f'{name} has {len(result.scores)} scores, expected {n_rows}')
+            scores[:, i] = result.scores
+            packed[i] = np.packbits(np.asarray(result.labels, dtype=bool))
+        return cls(names, scores, packed, n_rows)
+
+    def __len__(self):
+        return self.n_rows
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    @property
+    def nbytes(self):
+        return self.scores_matrix.nbytes + self.packed_labels.nbytes
+
+    def scores(self, name):
+        # a view, not a copy
+        return self.scores_matrix[:, self._columns[name]]
+
+    def labels(self, name):
+        return np.unpackbits(self.packed_labels[self._columns[name]], count=self.n_rows).view(bool)
+
+    def anomaly_index(self, name):
+        return np.flatnonzero(self.labels(name))
+
+    def count(self, name):
+        # set bits of the packed row; the padding bits past n_rows are always 0
+        return int(np.unpackbits(self.packed_labels[self._columns[name]]).sum())
+
+    def anomaly_points(self, name, x, y):
+        index = self.anomaly_index(name)
+        return np.asarray(x)[index], np.asarray(y)[index]
+
+    def any_labels(self, names=None):
+        # rows flagged by at least one of the detectors, combined on the packed bits
+        rows = [self._columns[name] for name in (names or self.names)]
+        combined = np.bitwise_or.reduce(self.packed_labels[rows], axis=0)
+        return np.unpackbits(combined, count=self.n_rows).view(bool)
+
+    def votes(self, names=None):
+        # how many of the detectors flag each row
+        rows = [self._columns[name] for name in (names or self.names)]
+        return np.unpackbits(self.packed_labels[rows], axis=1, count=self.n_rows).sum(axis=0, dtype=np.int16)
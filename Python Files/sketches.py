@@ -0,0 +1,183 @@
+# Mergeable histograms and quantile sketches for anomaly scores
+# Both are updated chunk by chunk and merged across shards, so score charts and IQR thresholds
+# never need the whole score column in memory.
+#
+# FixedHistogram: counts on edges agreed up front, exact. Summing the chunks gives the same counts
+# as np.histogram over all values with the same range; values outside it are only counted as
+# underflow / overflow. Shards merge when their edges match. Memory is O(bins).
+#
+# KLLSketch: the Karnin-Lang-Liberty quantile sketch. Level h keeps items of weight 2^h, a full
+# level is sorted and every other item (random offset) moves up. At most about 3k items are
+# retained however many values pass through. The rank of any quantile is off by at most rank_error(k) * n
+# with 99% confidence (about 1.3% of n at the default k=200); min, max and count are exact, and
+# the sketch is exact while fewer than k values have been seen.
+import math
+
+import numpy as np
+
+DEFAULT_K = 200
+CHUNK_SIZE = 1 << 20
+
+
+def rank_error(k=DEFAULT_K):
+    # normalised rank error at 99% confidence, the empirical fit published with Apache
+    # DataSketches' KLL sketch
+    return 2.296 / k ** 0.9723
+
+
+def chunks(values, size=CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class FixedHistogram:
+    def __init__(self, lo, hi, bins=50):
+        if not hi >= lo:
+            raise ValueError(f'histogram range [{lo}, {hi}] is empty')
+        if lo == hi:
+            # as np.histogram does for constant data
+            lo, hi = lo - 0.5, hi + 0.5
+        self.lo, self.hi, self.bins = float(lo), float(hi), int(bins)
+        self.counts = np.zeros(self.bins, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+
+    @property
+    def edges(self):
+        return np.linspace(self.lo, self.hi, self.bins + 1)
+
+    @property
+    def count(self):
+        return int(self.counts.sum()) + self.underflow + self.overflow
+
+    def update(self, values):
+        values = np.asarray(values)
+        below, above = values < self.lo, values > self.hi
+        outside = below | above
+        if outside.any():
+            self.underflow += int(np.count_nonzero(below))
+            self.overflow += int(np.count_nonzero(above))
+            values = values[~outside]
+        self.counts += np.histogram(values, bins=self.bins, range=(self.lo, self.hi))[0]
+        return self
+
+    def merge(self, other):
+        if (self.lo, self.hi, self.bins) != (other.lo, other.hi, other.bins):
+            raise ValueError('histograms with different edges cannot be merged')
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        return self
+
+
+class KLLSketch:
+    def __init__(self, k=DEFAULT_K, seed=0):
+        self.k = k
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def retained(self):
+        return sum(len(level) for level in self.levels)
+
+    @property
+    def nbytes(self):
+        return sum(level.nbytes for level in self.levels)
+
+    def _capacity(self, h):
+        # the top level holds k items, each level below 2/3 of the one above
+        return max(int(math.ceil(self.k * (2 / 3) ** (len(self.levels) - 1 - h))), 2)
+
+    def _compress(self):
+        # a new top level shrinks every capacity below it, so sweep until all levels fit
+        compacted = True
+        while compacted:
+            compacted = False
+            for h in range(len(self.levels)):
+                level = self.levels[h]
+                if len(level) <= self._capacity(h):
+                    continue
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                level = np.sort(level)
+                # an odd item out stays behind with its weight
+                keep = level[:len(level) % 2]
+                promoted = level[len(keep) + self._rng.integers(2)::2]
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate((self.levels[h + 1], promoted))
+                compacted = True
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self._compress()
+        return self
+
+    def merge(self, other):
+        if other.k != self.k:
+            raise ValueError('sketches with different k cannot be merged')
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, level in enumerate(other.levels):
+            self.levels[h] = np.concatenate((self.levels[h], level))
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _weighted(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2 ** h, dtype=np.float64) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        return items[order], weights[order]
+
+    def quantiles(self, qs):
+        # linear interpolation between retained items placed at the middle of the ranks they
+        # stand for; with every weight 1 this is np.percentile's default
+        qs = np.asarray(qs, dtype=np.float64)
+        if not self.count:
+            return np.full(qs.shape, math.nan)
+        items, weights = self._weighted()
+        # compaction keeps the total weight equal to count
+        positions = np.cumsum(weights) - weights + (weights - 1) / 2
+        result = np.interp(qs * (self.count - 1), positions, items)
+        return np.clip(result, self.min, self.max)
+
+    def quantile(self, q):
+        return float(self.quantiles([q])[0])
+
+    def rank(self, x):
+        # estimated fraction of values <= x
+        if not self.count:
+            return math.nan
+        items, weights = self._weighted()
+        return float(weights[:np.searchsorted(items, x, side='right')].sum() / weights.sum())
+
+
+def quantile_sketch(scores, k=DEFAULT_K, chunk_size=CHUNK_SIZE):
+    sketch = KLLSketch(k)
+    for chunk in chunks(scores, chunk_size):
+        sketch.update(chunk)
+    return sketch
+
+
+def score_summary(scores, bins=50, k=DEFAULT_K, chunk_size=CHUNK_SIZE):
+    # (histogram over [min, max], quantile sketch) of a score array or memmap in two chunked
+    # passes: the sketch finds the range, the histogram is then exact on it
+    sketch = quantile_sketch(scores, k, chunk_size)
+    # no scores: empty bins over (0, 1), as np.histogram gives
+    lo, hi = (sketch.min, sketch.max) if sketch.count else (0.0, 1.0)
+    histogram = FixedHistogram(lo, hi, bins)
+    for chunk in chunks(scores, chunk_size):
+        histogram.update(chunk)
+    return histogram, sketch
@@ -0,0 +1,243 @@
+# Online anomaly detectors for live sensor feeds
+# Every detector keeps O(1) state, so memory stays fixed however long the stream runs.
+import math
+from collections import namedtuple
+from statistics import NormalDist
+
+import numpy as np
+
+from cf_kernel import ChangeFinderState
+
+Alert = namedtuple('Alert', ['detector', 'timestamp', 'value', 'score', 'threshold'])
+
+
+class Welford:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def update(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def running_batch(self, values):
+        # mean/variance seen *before* each value, then fold the whole batch into the state.
+        # Sums are taken around a shift so the cumulative sums stay well conditioned.
+        shift = self.mean if self.count else float(values[0])
+        y = values - shift
+        s1 = np.concatenate(([0.0], np.cumsum(y)))
+        s2 = self.m2 + np.concatenate(([0.0], np.cumsum(y * y)))
+        counts = self.count + np.arange(len(values) + 1, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = shift + s1 / counts
+            m2 = s2 - s1 * s1 / counts
+            variances = m2 / (counts - 1)
+        self.count += len(values)
+        self.mean = float(means[-1])
+        self.m2 = float(m2[-1])
+        return means[:-1], variances[:-1]
+
+
+class P2Quantile:
+    # Jain & Chlamtac P-squared estimator: five markers, no samples kept
+    def __init__(self, q):
+        self.q = q
+        self.count = 0
+        self._initial = []
+        self._heights = None
+        self._positions = [1, 2, 3, 4, 5]
+        self._desired = [1, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5]
+        self._increments = [0, q / 2, q, (1 + q) / 2, 1]
+
+    @property
+    def value(self):
+        if self._heights is not None:
+            return self._heights[2]
+        if not self._initial:
+            return math.nan
+        return float(np.percentile(self._initial, 100 * self.q))
+
+    def update(self, x):
+        self.count += 1
+        if self._heights is None:
+            self._initial.append(x)
+            if len(self._initial) == 5:
+                self._heights = sorted(self._initial)
+                self._initial = []
+            return
+        h, n = self._heights, self._positions
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= h[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+        for i in range(1, 4):
+            d = self._desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = h[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not h[i - 1] < height < h[i + 1]:
+                    height = h[i] + d * (h[i + d] - h[i]) / (n[i + d] - n[i])
+                h[i] = height
+                n[i] += d
+
+
+class OnlineDetector:
+    name = None
+
+    def score_batch(self, values):
+        # returns (scores, thresholds, flags); scores are NaN while the detector warms up
+        raise NotImplementedError
+
+    def update(self, timestamp, value):
+        scores, thresholds, flags = self.score_batch(np.array([value], dtype=np.float64))
+        if flags[0]:
+            return Alert(self.name, timestamp, float(value), float(scores[0]), float(np.broadcast_to(thresholds, 1)[0]))
+        return None
+
+    def update_batch(self, timestamps, values):
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return []
+        scores, thresholds, flags = self.score_batch(values)
+        thresholds = np.broadcast_to(thresholds, values.shape)
+        return [
+            Alert(self.name, timestamps[i], float(values[i]), float(scores[i]), float(thresholds[i]))
+            for i in np.flatnonzero(flags)
+        ]
+
+
+class OnlineHotelling(OnlineDetector):
+    name = 'hotelling'
+
+    def __init__(self, q=0.95, warmup=288):
+        # chi2.ppf(q, df=1) is the squared two-sided normal quantile
+        self.threshold = NormalDist().inv_cdf((1 + q) / 2) ** 2
+        self.warmup = max(warmup, 2)
+        self.stats = Welford()
+
+    def score_batch(self, values):
+        counts = self.stats.count + np.arange(len(values))
+        means, variances = self.stats.running_batch(values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = (values - means) ** 2 / variances
+        scores[counts < self.warmup] = np.nan
+        return scores, self.threshold, scores > self.threshold
+
+
+class OnlineVarianceBand(OnlineDetector):
+    name = 'variance'
+
+    def __init__(self, n_sigma=1.5, warmup=288):
+        self.threshold = n_sigma
+        self.warmup = max(warmup, 2)
+        self.stats = Welford()
+
+    def score_batch(self, values):
+        counts = self.stats.count + np.arange(len(values))
+        means, variances = self.stats.running_batch(values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = (values - means) / np.sqrt(variances)
+        scores[counts < self.warmup] = np.nan
+        return scores, self.threshold, np.abs(scores) > self.threshold
+
+
+class OnlineChangeFinder(OnlineDetector):
+    name = 'changefinder'
+
+    def __init__(self, r=0.002, order=1, smooth=250, iqr_factor=3, warmup=None, seed=None):
+        self.state = ChangeFinderState(r, order, smooth, rng=np.random.default_rng(seed))
+        self.iqr_factor = iqr_factor
+        # the SDAR stages need ~1/r points to forget their random start, keep those
+        # transient scores out of the quantile estimates
+        self.warmup = int(round(1 / r)) if warmup is None else warmup
+        self.scored = 0
+        self.q1 = P2Quantile(0.25)
+        self.q3 = P2Quantile(0.75)
+
+    @property
+    def threshold(self):
+        if self.q1.count < self.warmup:
+            return math.nan
+        q1, q3 = self.q1.value, self.q3.value
+        return q3 + (q3 - q1) * self.iqr_factor
+
+    def score_batch(self, values):
+        scores, first_ready = self.state.update(values)
+        scores[:first_ready if first_ready >= 0 else len(scores)] = np.nan
+        thresholds = np.empty(len(values))
+        for i, score in enumerate(scores.tolist()):
+            # compare against the threshold learned so far, then learn from this score
+            thresholds[i] = self.threshold
+            if not math.isnan(score):
+                self.scored += 1
+            if self.scored > self.warmup:
+                self.q1.update(score)
+                self.q3.update(score)
+        return scores, thresholds, scores > thresholds
+
+
+class StreamingEngine:
+    def __init__(self, detectors=None):
+        if detectors is None:
+            detectors = [OnlineHotelling(), OnlineVarianceBand(), OnlineChangeFinder()]
+        self.detectors = detectors
+
+    def update(self, timestamp, value):
+        alerts = [detector.update(timestamp, value) for detector in self.detectors]
+        return [alert for alert in alerts if alert is not None]
+
+    def score_batch(self, values):
+        # {detector name: (scores, thresholds, flags)}, for callers that draw the scores too
+        values = np.asarray(values, dtype=np.float64)
+        return {detector.name: detector.score_batch(values) for detector in self.detectors}
+
+    def update_batch(self, timestamps, values):
+        alerts = []
+        for detector in self.detectors:
+            alerts.extend(detector.update_batch(timestamps, values))
+        alerts.sort(key=lambda alert: alert.timestamp)
+        return alerts
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    from collections import Counter
+
+    from data_loader import load_arrays
+
+    timestamps, values = load_arrays(sys.argv[1] if len(sys.argv) > 1 else 'machine_temperature_system_failure.csv')
+    engine = StreamingEngine()
+    batch_size = 288
+    alerts = []
+    start = time.perf_counter()
+    for i in range(0, len(values), batch_size):
+        alerts.extend(engine.update_batch(timestamps[i:i + batch_size], values[i:i + batch_size]))
+    elapsed = time.perf_counter() - start
+    print(f'{len(values)} readings in {elapsed:.2f} s ({len(values) / elapsed:,.0f} readings/s)')
+    for detector, count in Counter(alert.detector for alert in alerts).items():
+        print(f'{detector}: {count} alerts')
@@ -0,0 +1,213 @@
+# Hyperparameter sweep against labelled anomaly windows
+# Each detector's parameters are split into fit parameters, which need a new model, and threshold
+# parameters, which only move the cut on the same scores (contamination of IsolationForest and
+# LOF, Hotelling's quantile, the sigma band, ChangeFinder's IQR factor). Every distinct fit runs
+# once on the parallel detector runner with the result cache; every threshold is then applied to
+# the cached scores and scored on point precision/recall, window hits and a NAB-style score.
+import argparse
+import itertools
+import json
+import time
+
+import numpy as np
+
+from anomaly_labels import AnomalyWindows
+from data_loader import load_arrays
+from detectors import DEFAULT_PARAMS, changefinder_threshold
+
+# NAB application profiles: weights of a true positive, a false positive and a missed window
+NAB_PROFILES = {
+    'standard': {'tp': 1.0, 'fp': 0.11, 'fn': 1.0},
+    'reward_low_fp': {'tp': 1.0, 'fp': 0.22, 'fn': 1.0},
+    'reward_low_fn': {'tp': 1.0, 'fp': 0.11, 'fn': 2.0},
+}
+
+# detector: (fit grid, threshold grid), around the values the dashboards use
+DEFAULT_GRID = {
+    'hotelling': ({}, {'q': [0.9, 0.95, 0.99, 0.995, 0.999]}),
+    'variance': ({}, {'n_sigma': [1.0, 1.5, 2.0, 2.5, 3.0]}),
+    'iforest': ({'n_estimators': [100, 300], 'max_samples': [256, 700, 2048]},
+                {'contamination': [0.01, 0.02, 0.05, 0.07, 0.1, 0.15]}),
+    'lof': ({'n_neighbors': [100, 250, 500, 1000]}, {'contamination': [0.01, 0.02, 0.05, 0.07, 0.1]}),
+    'changefinder': ({'r': [0.001, 0.002, 0.005, 0.01], 'smooth': [100, 250, 500]}, {'iqr_factor': [1.5, 3, 5]}),
+    'ocsvm': ({'nu': [0.05, 0.1, 0.2], 'gamma': [0.0001, 0.001, 0.01]}, {}),
+}
+
+
+def _hotelling_labels(result, q):
+    from scipy.stats import chi2
+
+    return result.scores > chi2.ppf(q=q, df=1)
+
+
+def _contamination_labels(result, contamination):
+    # IsolationForest and LOF put offset_ at this percentile of the training scores, and the
+    # trees / neighbourhoods do not depend on it
+    return result.scores < np.percentile(result.scores, 100.0 * contamination)
+
+
+# detector: labels(result, **threshold params)
+RETHRESHOLD = {
+    'hotelling': _hotelling_labels,
+    'variance': lambda result, n_sigma: np.abs(result.scores) > n_sigma,
+    'iforest': _contamination_labels,
+    'lof': _contamination_labels,
+    'changefinder': lambda result, iqr_factor: result.scores > changefinder_threshold(result.scores, iqr_factor),
+    'ocsvm': lambda result: np.asarray(result.labels, dtype=bool),
+}
+
+
+def grid_points(grid):
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def point_metrics(labels, truth):
+    tp = int(np.count_nonzero(labels & truth))
+    fp = int(np.count_nonzero(labels & ~truth))
+    fn = int(np.count_nonzero(~labels & truth))
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {'precision': precision, 'recall': recall, 'f1': f1, 'flagged': tp + fp}
+
+
+def scaled_sigmoid(y):
+    # NAB: 1 just after a window opens, 0 at its end, towards -1 long after it
+    return 2.0 / (1.0 + np.exp(np.clip(5.0 * y, -50.0, 50.0))) - 1.0
+
+
+def nab_score(labels, timestamps, windows, profile='standard'):
+    # raw NAB score normalised to 100 for a perfect detector and 0 for one that never fires.
+    # The first detection in a window earns tp * sigmoid(relative position), later ones in the
+    # same window are ignored; each detection outside the windows costs fp * sigmoid of its
+    # distance past the preceding window, in window lengths (full cost before the first window).
+    weights = NAB_PROFILES[profile]
+    detected = np.asarray(timestamps, dtype=np.int64)[np.asarray(labels, dtype=bool)]
+    starts, ends = windows.starts, windows.ends
+    lengths = np.maximum(ends - starts, 1).astype(np.float64)
+    previous = np.searchsorted(starts, detected, side='right') - 1
+    inside = previous >= 0
+    inside[inside] = detected[inside] <= ends[previous[inside]]
+
+    raw = 0.0
+    if inside.any():
+        hit_windows, first = np.unique(previous[inside], return_index=True)
+        first_times = detected[inside][first]
+        raw += weights['tp'] * scaled_sigmoid((first_times - ends[hit_windows]) / lengths[hit_windows]).sum()
+        missed = len(starts) - len(hit_windows)
+    else:
+        missed = len(starts)
+    raw -= weights['fn'] * missed
+
+    outside = ~inside
+    after = outside & (previous >= 0)
+    raw += weights['fp'] * scaled_sigmoid((detected[after] - ends[previous[after]]) / lengths[previous[after]]).sum()
+    raw -= weights['fp'] * np.count_nonzero(outside & (previous < 0))
+
+    perfect = weights['tp'] * scaled_sigmoid(-1.0) * len(starts)
+    null = -weights['fn'] * len(starts)
+    return 100.0 * (raw - null) / (perfect - null) if perfect != null else 0.0
+
+
+def evaluate(labels, timestamps, windows, truth):
+    labels = np.asarray(labels, dtype=bool)
+    row = point_metrics(labels, truth)
+    ids = windows.interval_ids(timestamps[labels])
+    row['windows_hit'] = int(len(np.unique(ids[ids >= 0])))
+    row['windows'] = len(windows)
+    for profile in NAB_PROFILES:
+        row[f'nab_{profile}'] = nab_score(labels, timestamps, windows, profile)
+    return row
+
+
+def fit_jobs(grid, fixed=None):
+    # {label: (detector, fit params)} for every distinct fit, labels like 'iforest#3'
+    fixed = fixed or {}
+    jobs = {}
+    for name, (fit_grid, _) in grid.items():
+        for i, params in enumerate(grid_points(fit_grid)):
+            jobs[f'{name}#{i}'] = (name, {**fixed.get(name, {}), **params})
+    return jobs
+
+
+def sweep(timestamps, values, windows, grid=None, fixed=None, cache=True, max_workers=None, report=print):
+    from compute import detector_results
+
+    grid = grid or DEFAULT_GRID
+    truth, _ = windows.label(timestamps)
+    jobs = fit_jobs(grid, fixed)
+    began = time.perf_counter()
+    results = detector_results(values, jobs, cache) if max_workers is None else _run(values, jobs, cache, max_workers)
+    report(f'{len(jobs)} fits in {time.perf_counter() - began:.1f} s')
+
+    rows = []
+    began = time.perf_counter()
+    for label, (name, fit_params) in jobs.items():
+        for threshold_params in grid_points(grid[name][1]):
+            labels = RETHRESHOLD[name](results[label], **threshold_params)
+            rows.append({'detector': name, 'params': {**DEFAULT_PARAMS[name], **fit_params, **threshold_params},
+                         **evaluate(labels, timestamps, windows, truth)})
+    report(f'{len(rows)} configurations scored in {time.perf_counter() - began:.2f} s')
+    return rows
+
+
+def _run(values, jobs, cache, max_workers):
+    from detector_runner import run_detectors
+    from result_cache import ResultCache
+
+    return run_detectors(values, jobs, cache=ResultCache() if cache else None, max_workers=max_workers)
+
+
+def best(rows, metric='nab_standard', per_detector=1):
+    ranked = sorted(rows, key=lambda row: -row[metric])
+    picked, counts = [], {}
+    for row in ranked:
+        if counts.get(row['detector'], 0) < per_detector:
+            picked.append(row)
+            counts[row['detector']] = counts.get(row['detector'], 0) + 1
+    return picked
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sweep detector hyperparameters against labelled anomaly windows.')
+    parser.add_argument('csv', nargs='?', default='machine_temperature_system_failure.csv')
+    parser.add_argument('--windows', default='anomaly_windows.json')
+    parser.add_argument('--detectors', default=','.join(DEFAULT_GRID), help='comma separated')
+    parser.add_argument('--metric', default='nab_standard',
+                        choices=['precision', 'recall', 'f1'] + [f'nab_{profile}' for profile in NAB_PROFILES])
+    parser.add_argument('--top', type=int, default=3, help='configurations shown per detector')
+    parser.add_argument('--ocsvm-mode', default='nystroem', choices=['exact', 'nystroem', 'sample'])
+    parser.add_argument('--lof-mode', default='sorted', choices=['exact', 'sorted'])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--output', help='write every configuration and its metrics as JSON')
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.detectors.split(',') if name.strip()]
+    unknown = sorted(set(names) - set(DEFAULT_GRID))
+    if unknown:
+        parser.error(f'unknown detectors: {", ".join(unknown)}')
+    timestamps, values = load_arrays(args.csv)
+    windows = AnomalyWindows.from_json(args.windows, series=args.csv)
+    fixed = {'ocsvm': {'mode': args.ocsvm_mode}, 'lof': {'mode': args.lof_mode}}
+    rows = sweep(timestamps, values, windows, {name: DEFAULT_GRID[name] for name in names},
+                 fixed=fixed, cache=not args.no_cache, max_workers=args.workers)
+
+    print(f"{'detector':<14}{args.metric:>14}{'precision':>11}{'recall':>9}{'f1':>7}{'windows':>9}  params")
+    for row in best(rows, args.metric, args.top):
+        tuned = {key: value for key, value in row['params'].items() if key in _swept_keys(row['detector'])}
+        print(f"{row['detector']:<14}{row[args.metric]:>14.3f}{row['precision']:>11.3f}{row['recall']:>9.3f}"
+              f"{row['f1']:>7.3f}{row['windows_hit']:>5}/{row['windows']:<3}  {tuned}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+def _swept_keys(name):
+    fit_grid, threshold_grid = DEFAULT_GRID[name]
+    return set(fit_grid) | set(threshold_grid)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+# The modules live in a flat "Python Files" directory (not a package), so put it on the path
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Python Files'))
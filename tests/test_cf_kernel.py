@@ -0,0 +1,39 @@
+# cf_kernel against the reference changefinder.ChangeFinder; both draw their SDAR starting
+# points from the legacy global generator, so the same np.random.seed() gives the same run
+import numpy as np
+import pytest
+
+from cf_kernel import ChangeFinderState, changefinder_scores
+
+changefinder = pytest.importorskip('changefinder')
+
+
+def series(n=1500, seed=1):
+    rng = np.random.default_rng(seed)
+    values = 80 + np.cumsum(rng.normal(0, 0.3, n))
+    values[n // 2:] += 6
+    return values
+
+
+def reference_scores(values, r, order, smooth):
+    cf = changefinder.ChangeFinder(r=r, order=order, smooth=smooth)
+    return np.array([cf.update(x) for x in values])
+
+
+@pytest.mark.parametrize('r, order, smooth', [(0.002, 1, 250), (0.02, 1, 7), (0.02, 2, 7), (0.05, 3, 11)])
+def test_matches_changefinder(r, order, smooth):
+    values = series()
+    np.random.seed(0)
+    expected = reference_scores(values, r, order, smooth)
+    np.random.seed(0)
+    scores = changefinder_scores(values, r, order, smooth)
+    np.testing.assert_allclose(scores, expected, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize('order', [1, 2])
+def test_chunked_updates_match_one_call(order):
+    values = series()
+    whole = changefinder_scores(values, 0.02, order, 7, rng=np.random.default_rng(3))
+    state = ChangeFinderState(0.02, order, 7, rng=np.random.default_rng(3))
+    parts = [state.update(chunk)[0] for chunk in np.array_split(values, [1, 5, 300, 301, 900])]
+    np.testing.assert_array_equal(np.concatenate(parts), whole)
@@ -0,0 +1,25 @@
+# max_points is a hard cap on what decimate returns, whatever the budget and the anomalies kept
+import numpy as np
+import pytest
+
+from decimation import decimate
+
+
+@pytest.mark.parametrize('method', ['minmax', 'lttb'])
+@pytest.mark.parametrize('max_points', [1, 2, 3, 4, 5, 7, 8, 13, 100, 4000])
+@pytest.mark.parametrize('n_keep', [0, 1, 3, 50, 5000])
+def test_max_points_is_a_hard_cap(method, max_points, n_keep):
+    rng = np.random.default_rng(0)
+    x = np.arange(20000, dtype=np.float64)
+    y = rng.normal(size=len(x))
+    keep = rng.choice(len(x), n_keep, replace=False)
+    shown = decimate(x, y, max_points, method, keep)
+    assert len(shown) <= max_points
+    assert np.all(np.diff(shown) > 0)
+
+
+def test_kept_indices_survive_within_half_the_budget():
+    x = np.arange(10000, dtype=np.float64)
+    y = np.sin(x / 50)
+    keep = np.array([10, 5000, 9990])
+    assert np.isin(keep, decimate(x, y, 100, 'lttb', keep)).all()
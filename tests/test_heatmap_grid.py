@@ -0,0 +1,54 @@
+# HeatmapGrid against the pandas pivot_table it replaced in Heatmap.py
+import numpy as np
+import pandas as pd
+
+from heatmap_grid import DAY_MS, SLOT_MS, HeatmapGrid, HeatmapWriter
+
+
+def readings(days=12, seed=0):
+    # 5-minute readings with a few jittered stamps (two readings in one cell) and ~5% dropped
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2013-12-02T00:00', 'ms').astype(np.int64)
+    timestamps = start + np.arange(days * DAY_MS // SLOT_MS) * SLOT_MS
+    timestamps[::97] += 60_000
+    keep = rng.random(len(timestamps)) > 0.05
+    timestamps = timestamps[keep]
+    return timestamps, 80 + rng.normal(0, 5, len(timestamps))
+
+
+def pivot(timestamps, values):
+    data = pd.DataFrame({'timestamp': pd.to_datetime(timestamps, unit='ms'), 'value': values})
+    data['date'] = data['timestamp'].dt.strftime('%Y-%m-%d')
+    data['time'] = data['timestamp'].dt.floor('5min').dt.strftime('%H:%M:%S')
+    table = data.pivot_table(values='value', index='date', columns='time', aggfunc='mean')
+    fill = table.mean().mean()
+    return table.fillna(fill).values.T, fill
+
+
+def test_grid_matches_pivot_table():
+    timestamps, values = readings()
+    expected, fill = pivot(timestamps, values)
+    grid = HeatmapGrid.from_arrays(timestamps, values)
+    assert grid.grid.shape == expected.shape
+    np.testing.assert_allclose(grid.grid, expected.astype(np.float32), rtol=1e-6)
+    np.testing.assert_allclose(grid.fill_value, fill, rtol=1e-9)
+
+
+def test_updates_match_one_build():
+    timestamps, values = readings()
+    whole = HeatmapGrid.from_arrays(timestamps, values)
+    grid = HeatmapGrid.from_arrays(timestamps[:1000], values[:1000])
+    for part in np.array_split(np.arange(1000, len(values)), 7):
+        grid.update(timestamps[part], values[part])
+    grid.refill()
+    np.testing.assert_allclose(grid.grid, whole.grid, rtol=1e-6)
+
+
+def test_writer_matches_grid(tmp_path):
+    timestamps, values = readings()
+    grid = HeatmapGrid.from_arrays(timestamps, values)
+    writer = HeatmapWriter(str(tmp_path / 'heatmap.npy'), grid.origin_ms)
+    for part in np.array_split(np.arange(len(values)), 5):
+        writer.update(timestamps[part], values[part])
+    writer.close()
+    np.testing.assert_allclose(np.load(writer.path).T, grid.grid, rtol=1e-6)
@@ -0,0 +1,53 @@
+# The compiled IsolationForest must score exactly like the forest it came from
+import numpy as np
+import pytest
+
+from model_registry import StepScorer, compile_isolation_forest, load_model, save_model
+
+ensemble = pytest.importorskip('sklearn.ensemble')
+
+
+@pytest.fixture(scope='module')
+def forest():
+    rng = np.random.default_rng(0)
+    values = np.concatenate([rng.normal(80, 5, 4000), rng.normal(20, 3, 40)])
+    model = ensemble.IsolationForest(n_estimators=60, random_state=0).fit(values.reshape(-1, 1))
+    return model, values
+
+
+def probes(steps, values):
+    # the training data, fresh readings, every breakpoint and the float32 steps either side of it
+    breaks = np.asarray(steps.breaks)
+    return np.concatenate([
+        values,
+        np.random.default_rng(1).uniform(-50, 200, 5000),
+        breaks,
+        np.nextafter(breaks, np.float32(-np.inf)),
+        np.nextafter(breaks, np.float32(np.inf)),
+        [-1e9, 1e9],
+    ]).astype(np.float64)
+
+
+def test_step_scorer_is_bit_exact(forest):
+    model, values = forest
+    steps = compile_isolation_forest(model)
+    x = probes(steps, values)
+    np.testing.assert_array_equal(steps.decision_function(x.reshape(-1, 1)), model.decision_function(x.reshape(-1, 1)))
+
+
+def test_saved_model_loads_compiled(forest, tmp_path):
+    model, values = forest
+    save_model('reference', model, {'detector': 'iforest'}, directory=str(tmp_path))
+    loaded, metadata = load_model('reference', directory=str(tmp_path))
+    assert metadata['compiled'] and isinstance(loaded, StepScorer)
+    x = values.reshape(-1, 1)
+    np.testing.assert_array_equal(loaded.decision_function(x), model.decision_function(x))
+
+
+def test_constant_readings_compile_to_one_bucket():
+    # a stuck sensor leaves the trees without a single split
+    model = ensemble.IsolationForest(n_estimators=20, random_state=0).fit(np.full((500, 1), 80.0))
+    steps = compile_isolation_forest(model)
+    assert len(steps.breaks) == 0 and len(steps.table) == 1
+    x = np.array([-1e9, 0.0, 79.9, 80.0, 80.1, 1e9]).reshape(-1, 1)
+    np.testing.assert_array_equal(steps.decision_function(x), model.decision_function(x))